@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Measures the effect of --locality-order on deleting a batch planned from a
+single target. The planners only ever pick top-level items of the target, so
+the batch is a set of top-level files and folders (each folder holding a few
+files of its own) handed to the same delete_inventory() that cleanup_manager.py
+uses. The same target is built twice; once the batch is deleted in a shuffled
+(planner-like, ie by age) order, and once in locality order. The time taken to
+sort is included in the locality timing, and the caches are dropped before
+each run when that is allowed (see drop_caches()).
+
+Run this on the kind of volume you care about (with --dir), since the effect
+depends heavily on the underlying storage; on SSDs and tmpfs there is little
+to gain.
+
+    python benchmarks/bench_locality.py [--files N] [--folders N] [--folder-files N] [--dir D]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import cleanup_manager
+from tests.helpers import QuietLogger
+
+
+def build(base, files, folders, folder_files):
+    """
+    :return: the root of a new target, and lists of the top-level files and
+             folders in it
+    """
+    root        = tempfile.mkdtemp(prefix='bench_locality.', dir=base)
+    top_files   = []
+    top_folders = []
+    for i in range(files):
+        path = os.path.join(root, 'file{}'.format(i))
+        with open(path, 'w') as handle:
+            handle.write('x' * 512)
+        top_files.append(path)
+    for i in range(folders):
+        folder = os.path.join(root, 'folder{}'.format(i))
+        os.mkdir(folder)
+        for j in range(folder_files):
+            with open(os.path.join(folder, 'file{}'.format(j)), 'w') as handle:
+                handle.write('x' * 512)
+        top_folders.append(folder)
+    return root, top_files, top_folders
+
+
+def drop_caches():
+    """
+    Flushes dirty data and then empties the kernel's page, dentry, and inode
+    caches, so that each run starts out cold. Dropping the caches needs root
+    (writing to /proc/sys/vm/drop_caches on Linux, or running purge on macOS).
+
+    :return: True if the caches were dropped, False if only the sync happened
+    """
+    if hasattr(os, 'sync'):
+        os.sync()
+    else:
+        os.system('sync')
+
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/sys/vm/drop_caches', 'w') as control:
+                control.write('3\n')
+            return True
+        except IOError:
+            return False
+    elif sys.platform == 'darwin':
+        with open(os.devnull, 'w') as devnull:
+            try:
+                return subprocess.call(['purge'], stdout=devnull, stderr=devnull) == 0
+            except OSError:
+                return False
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark locality-ordered deletion.")
+    parser.add_argument('--files', type=int, default=10000, help="top-level files (default: 10000)")
+    parser.add_argument('--folders', type=int, default=2000, help="top-level folders (default: 2000)")
+    parser.add_argument('--folder-files', type=int, default=5, help="files in each folder (default: 5)")
+    parser.add_argument('--dir', default=None, help="where to build the targets (default: system temp)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logger = QuietLogger()
+    warm   = False
+    print("{:<12} {:>10} {:>10} {:>8}".format('order', 'items', 'seconds', 'caches'))
+
+    for name in ['planner', 'locality']:
+        root, files, folders = build(args.dir, args.files, args.folders, args.folder_files)
+        rng = random.Random(args.seed)
+        rng.shuffle(files)
+        rng.shuffle(folders)
+        cold = drop_caches()
+
+        start = time.time()
+        cleanup_manager.delete_inventory([], files, folders, False, None, 1, name == 'locality', logger)
+        elapsed = time.time() - start
+
+        shutil.rmtree(root)
+        print("{:<12} {:>10} {:>10.3f} {:>8}".format(name, len(files) + len(folders), elapsed, 'dropped' if cold else 'warm'))
+        warm = warm or not cold
+
+    if warm:
+        print('')
+        print("Caches could not be dropped (run as root to do so), so the target was still")
+        print("cached when it was deleted and these timings understate the effect of")
+        print("locality ordering on a cold volume.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Measures how the inventory and planning code scales with the number of items
+in the target. Trees are built in a filesystem.MemoryFilesystem, so nothing
+touches the disk and the numbers only reflect the algorithms themselves (and
+are repeatable for a given seed).
+
+Each top-level item is either a folder holding a few files and a subfolder, a
+file, or a link to another top-level item (or somewhere outside the target).
+The in-memory size-based planner is quadratic in the number of top-level
+items, so it is skipped for sizes above --size-limit.
+
+    python benchmarks/bench_planner.py [--sizes N [N ...]] [--size-limit N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cleanup_management import analysis, filesystem, metrics
+from tests.helpers import QuietLogger
+
+
+def build(count, seed):
+    """
+    :return: an in-memory filesystem with 'count' top-level items under
+             '/target', and the total size of everything in it
+    """
+    rng   = random.Random(seed)
+    fs    = filesystem.MemoryFilesystem()
+    now   = time.time()
+    total = 0
+    fs.makedirs('/target')
+    fs.makedirs('/elsewhere')
+    for i in range(count):
+        path  = '/target/item{}'.format(i)
+        mtime = now - rng.randint(0, 365 * 86400)
+        kind  = rng.random()
+        if kind < 0.4:
+            fs.mkdir(path, mtime)
+            fs.mkdir(path + '/sub', mtime)
+            for j in range(3):
+                size = rng.randint(0, 1 << 20)
+                fs.add_file('{}/{}file{}'.format(path, '' if j else 'sub/', j), size, mtime - rng.randint(0, 86400))
+                total += size
+        elif kind < 0.95:
+            size = rng.randint(0, 1 << 20)
+            fs.add_file(path, size, mtime)
+            total += size
+        elif kind < 0.98 and i > 0:
+            fs.symlink('item{}'.format(rng.randint(0, i - 1)), path, mtime)
+        else:
+            fs.symlink('/elsewhere', path, mtime)
+    return fs, total
+
+
+def timed(function, *args, **kwargs):
+    """
+    :return: the number of seconds it took to call the function
+    """
+    start = time.time()
+    function(*args, **kwargs)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the inventory and planners.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help="numbers of top-level items to try (default: 1000 10000 100000)")
+    parser.add_argument('--size-limit', type=int, default=10000,
+                        help="largest size to run the in-memory size planner on (default: 10000)")
+    parser.add_argument('--max-records', type=int, default=100000,
+                        help="records the bounded planner holds in memory (default: 100000)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logger = QuietLogger()
+    print("{:>10} {:>10} {:>10} {:>10} {:>10}".format('items', 'inventory', 'date', 'size', 'bounded'))
+
+    for count in args.sizes:
+        fs, total  = build(count, args.seed)
+        keep_after = time.time() - 180 * 86400
+        freeup     = total // 2
+        metrics.reset()
+
+        start = time.time()
+        folders, files, links = analysis.get_inventory('/target', logger, fs=fs)
+        inventory = time.time() - start
+
+        date = timed(analysis.get_date_based_deletable_inventory, keep_after, logger,
+                     folders=folders, files=files, links=links, fs=fs)
+        if count <= args.size_limit:
+            size = "{:>10.3f}".format(timed(analysis.get_size_based_deletable_inventory, freeup, logger,
+                                            folders=folders, files=files, links=links, fs=fs))
+        else:
+            size = "{:>10}".format('-')
+        bounded = timed(analysis.get_bounded_size_based_deletable_inventory, freeup, logger, '/target',
+                        max_records=args.max_records, fs=fs)
+
+        print("{:>10} {:>10.3f} {:>10.3f} {} {:>10.3f}".format(count, inventory, date, size, bounded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Compares shutil.rmtree() with cleanup.remove_tree_parallel() on synthetic
+trees that are either very wide (many directories side by side) or very deep
+(long chains of nested directories).
+
+    python benchmarks/bench_remove.py [--scale N] [--workers 1,2,4,8] [--dir D]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cleanup_management import cleanup
+from tests.helpers import QuietLogger
+
+
+def build_wide(root, scale):
+    """
+    Creates 'scale' directories directly inside 'root', each with 'scale' files.
+    """
+    for i in range(scale):
+        directory = os.path.join(root, 'dir{}'.format(i))
+        os.mkdir(directory)
+        for j in range(scale):
+            open(os.path.join(directory, 'file{}'.format(j)), 'w').close()
+
+
+def build_deep(root, scale):
+    """
+    Creates 'scale' chains of 'scale' nested directories, with a few files at
+    every level.
+    """
+    for i in range(scale):
+        directory = os.path.join(root, 'chain{}'.format(i))
+        for depth in range(scale):
+            os.mkdir(directory)
+            for j in range(4):
+                open(os.path.join(directory, 'file{}'.format(j)), 'w').close()
+            directory = os.path.join(directory, 'd')
+
+
+def time_removal(build, scale, remove, base):
+    """
+    :return: the number of seconds 'remove' took to delete a freshly-built tree
+    """
+    root = tempfile.mkdtemp(prefix='bench_remove.', dir=base)
+    build(root, scale)
+    start = time.time()
+    remove(root)
+    elapsed = time.time() - start
+    if os.path.exists(root):
+        raise RuntimeError("{} was not removed".format(root))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recursive folder removal.")
+    parser.add_argument('--scale', type=int, default=200, help="tree width/depth (default: 200)")
+    parser.add_argument('--workers', default='1,2,4,8', help="comma-separated worker counts")
+    parser.add_argument('--dir', default=None, help="where to build the trees (default: system temp)")
+    args = parser.parse_args()
+
+    logger  = QuietLogger()
+    workers = [int(count) for count in args.workers.split(',')]
+
+    print("{:<6} {:<22} {:>10}".format('tree', 'method', 'seconds'))
+    for name, build in [('wide', build_wide), ('deep', build_deep)]:
+        elapsed = time_removal(build, args.scale, shutil.rmtree, args.dir)
+        print("{:<6} {:<22} {:>10.3f}".format(name, 'shutil.rmtree', elapsed))
+        for count in workers:
+            remove  = lambda root: cleanup.remove_tree_parallel(root, logger, count)
+            elapsed = time_removal(build, args.scale, remove, args.dir)
+            print("{:<6} {:<22} {:>10.3f}".format(name, 'parallel x{}'.format(count), elapsed))
+
+
+if __name__ == '__main__':
+    main()
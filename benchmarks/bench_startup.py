@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Measures how long it takes to start Cleanup Manager, which matters when it is
+run often from short-lived cron and launchd jobs. Each command is run in a
+fresh interpreter several times and the fastest time is reported, since that
+is the one least disturbed by everything else happening on the machine.
+
+    bare interpreter:  starting Python and doing nothing
+    import package:    importing cleanup_management
+    --version:         running the command line tool up to argument parsing
+    --report (empty):  a complete report run against an empty directory
+
+Also lists the modules each import pulls in that the bare interpreter doesn't,
+which is the first place to look when startup gets slower.
+
+    python benchmarks/bench_startup.py [--runs N]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT   = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'cleanup_manager.py')
+
+
+def best_of(command, runs):
+    """
+    :return: the fastest time (in seconds) out of 'runs' runs of the command
+    """
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call(command, cwd=ROOT, stdout=devnull, stderr=devnull)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+def loaded_modules(statement):
+    """
+    :return: the set of modules loaded after running 'statement'
+    """
+    code   = "import sys; {}; print('\\n'.join(sorted(k for k, v in sys.modules.items() if v)))".format(statement)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return set(output.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Cleanup Manager's startup time.")
+    parser.add_argument('--runs', type=int, default=20, help="runs of each command (default: 20)")
+    args = parser.parse_args()
+
+    empty = tempfile.mkdtemp(prefix='bench_startup.')
+    try:
+        commands = [
+            ('bare interpreter', [sys.executable, '-c', 'pass']),
+            ('import package',   [sys.executable, '-c', 'import cleanup_management']),
+            ('--version',        [sys.executable, SCRIPT, '--version']),
+            ('--report (empty)', [sys.executable, SCRIPT, '-n', '--report', empty]),
+        ]
+        print("{:<20} {:>10}".format('command', 'ms'))
+        for name, command in commands:
+            print("{:<20} {:>10.1f}".format(name, best_of(command, args.runs) * 1000))
+    finally:
+        shutil.rmtree(empty)
+
+    extra = loaded_modules('import cleanup_management') - loaded_modules('pass')
+    print('')
+    print("Modules loaded by importing cleanup_management:")
+    print("    " + ' '.join(sorted(name for name in extra if '.' not in name)))
+
+
+if __name__ == '__main__':
+    main()
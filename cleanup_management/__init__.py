@@ -1,8 +1,17 @@
 import analysis
 import cleanup
+import filesystem
+import logs
+import metrics
+import symlinks
+import volume
+
+# The modules behind the optional modes (estimate, journal, report, scan, spill,
+# and watch) are only imported when they're used, to keep starting up quick.
+# They can still be imported directly, eg 'from cleanup_management import watch'.
 
 __version__ = '1.5.0'
-__all__     = ['analysis', 'cleanup']
+__all__     = ['analysis', 'cleanup', 'estimate', 'filesystem', 'journal', 'logs', 'metrics', 'report', 'scan', 'spill', 'symlinks', 'volume', 'watch']
 
 if __name__ == "__main__":
     print("Cleanup Management, version: {}".format(__version__))
@@ -1,7 +1,14 @@
+import fnmatch
+import itertools
 import os
+import time
 
+import filesystem
+import metrics
+import symlinks
 
-def get_date_based_deletable_inventory(keep_after, logger, target=None, folders=None, files=None, links=None, trigger=None):
+
+def get_date_based_deletable_inventory(keep_after, logger, target=None, folders=None, files=None, links=None, trigger=None, fs=None, resolver=None):
     """
     Finds all of the items within an inventory that can be deleted based on
     their last modification date.
@@ -13,13 +20,23 @@ def get_date_based_deletable_inventory(keep_after, logger, target=None, folders=
     :param folders: an inventory of the folders (see get_inventory())
     :param files: an inventory of the files (see get_inventory())
     :param links: an inventory of the links (see get_inventory())
+    :param trigger: a trigger file name or glob pattern (or a list of them) to
+                    scan for when building the inventory from 'target'; if the
+                    inventory is given, it is expected to have been gathered
+                    with the same triggers
+    :param fs: the filesystem to take the inventory from (see filesystem.py)
+    :param resolver: the symlinks.LinkResolver the inventory's links were
+                     resolved with, so its work is shared with working out
+                     which links to unmake
     :return: lists of folers, files, and links to be deleted and/or unmade
     """
     if folders is None or files is None or links is None:
         if not target:
             raise ValueError("Must give either a target or the inventory.")
         else:
-            folders, files, links = get_inventory(target, logger)
+            if resolver is None:
+                resolver = symlinks.LinkResolver(target, fs)
+            folders, files, links = get_inventory(target, logger, triggers=trigger, fs=fs, resolver=resolver)
     else:
         # Make copies of the inventory lists just in case the user wanted to
         # keep the originals.
@@ -29,61 +46,25 @@ def get_date_based_deletable_inventory(keep_after, logger, target=None, folders=
 
     logger.verbose("Getting date-based deletable inventory:")
 
-    # Check if any of the folders contain the trigger file.
-    # If they do, and if that trigger file's last modified timestamp is within
-    # the specified range, set that folder to be removed.
-    delete_folders = []
-    if trigger is not None:
-        pop_indices = []
-        # Iterate over the folders with their index in the list.
-        for index, folder in enumerate(folders):
-            triggerpath = os.path.join(folder[0], trigger)
-            # Test if the trigger file exists in the folder.
-            try:
-                if os.path.getmtime(triggerpath) < keep_after:
-                    # If the file exists and its timestamp is old enough, then
-                    # the folder should be deleted.
-                    pop_indices.append(index)
-            except OSError:
-                # The file does not exist in the folder. That's fine; we'll just
-                # continue on and let it be deleted naturally if it ought to be.
-                continue
-        # Go through the marked indices and add the appropriate folders to the
-        # deletion list.
-        for index in pop_indices:
-            delete_folders.append(folders[index])
-        # Then go through and remove those folders from the original list.
-        for index in pop_indices:
-            folders.pop(index)
-        # Note that these steps must be separated. If the folders were popped at
-        # the same time they're added to the delete_folders list, the indices
-        # would change and you would be adding the wrong folders.
-
     # Find the folders and files that need to be deleted.
     # If the item's score is above the threshold value, it will be deleted.
     # Folder and file lists are assumed to contain tuples as:
     #     (path, age, size)
     # Effectively, for each folder/file: if that item has a timestamp that is
     # less than the 'keep_after' value, it gets added to the list.
-    delete_folders += [folder[0] for folder in folders if folder[1] < keep_after]
-    delete_files    = [file[0] for file in files if file[1] < keep_after]
+    # Folders containing a trigger file already carry that trigger's timestamp
+    # as their age (see get_inventory()), so they need no special handling.
+    delete_folders = [folder[0] for folder in folders if folder[1] < keep_after]
+    delete_files   = [file[0] for file in files if file[1] < keep_after]
 
     # Now handle links. This is a bit trickier.
-    # Link array is assumed to contain tuples as:
-    #     (link location, target location, inside)
-    delete_links   = []
-    for link in links:
-        # If the link points inside the 'target' directory and the target of the
-        # link will be deleted during cleanup, then remove the link.
-        if link[2] and (link[1] in delete_folders or link[1] in delete_files):
-            delete_links.append(link[0])
-        else:
-            for folder in delete_folders:
-                # If the link exists inside of or points into a folder that is
-                # going to be deleted, then remove the link.
-                if link[0].startswith(folder) or link[1].startswith(folder):
-                    delete_links.append(link[0])
-                    break
+    delete_links = _get_deletable_links(links, delete_folders, delete_files, fs, resolver)
+
+    # Keep track of how much was planned for the metrics.
+    sizes = dict((item[0], item[2]) for item in folders + files if item[1] < keep_after)
+    metrics.record_plan('folder', delete_folders, sizes)
+    metrics.record_plan('file', delete_files, sizes)
+    metrics.record_plan('link', delete_links)
 
     # Print out lots of fun information if it's warranted.
     for folder in delete_folders:
@@ -97,7 +78,7 @@ def get_date_based_deletable_inventory(keep_after, logger, target=None, folders=
     return delete_folders, delete_files, delete_links
 
 
-def get_size_based_deletable_inventory(target_space, logger, target=None, oldest_first=True, overflow=False, folders=None, files=None, links=None):
+def get_size_based_deletable_inventory(target_space, logger, target=None, oldest_first=True, overflow=False, folders=None, files=None, links=None, fs=None, resolver=None):
     """
     Finds all of the items within an inventory that can be deleted based on a
     given target amount of space to attempt to free up.
@@ -111,14 +92,22 @@ def get_size_based_deletable_inventory(target_space, logger, target=None, oldest
     :param folders: an inventory of the folders (see get_inventory())
     :param files: an inventory of the files (see get_inventory())
     :param links: an inventory of the links (see get_inventory())
+    :param fs: the filesystem to take the inventory from (see filesystem.py)
+    :param resolver: the symlinks.LinkResolver the inventory's links were
+                     resolved with, so its work is shared with working out
+                     which links to unmake
     :return: list of folders, files, and links to be deleted and/or unmade and
              the total amount of stuff deleted (in bytes)
+    :raises ValueError: if the inventory has folders that were never measured
+                        because they held a trigger
     """
     if folders is None or files is None or links is None:
         if not target:
             raise ValueError("Must give either a target or the inventory.")
         else:
-            folders, files, links = get_inventory(target, logger)
+            if resolver is None:
+                resolver = symlinks.LinkResolver(target, fs)
+            folders, files, links = get_inventory(target, logger, fs=fs, resolver=resolver)
     else:
         # Make copies of the inventory lists just in case the user wanted to
         # keep the originals.
@@ -126,12 +115,21 @@ def get_size_based_deletable_inventory(target_space, logger, target=None, oldest
         files   = list(files)
         links   = list(links)
 
+    # Folders that held a trigger were never measured, so there's no telling
+    # how much deleting them would free up.
+    for folder in folders:
+        if folder[2] is None:
+            raise ValueError("Cannot plan by size with an inventory taken with triggers: {} was never measured.".format(folder[0]))
+
     logger.verbose("Getting size-based deletable inventory:")
 
+    # Remember the size of everything for the metrics, since items are removed
+    # from the inventory as they're considered.
+    sizes = dict((item[0], item[2]) for item in folders + files)
+
     # Initialize lists to be returned.
     delete_folders = []
     delete_files   = []
-    delete_links   = []
 
     # # Set the index key based on oldest/largest preference.
     # if oldest_first:
@@ -225,20 +223,12 @@ def get_size_based_deletable_inventory(target_space, logger, target=None, oldest
             break
 
     # Now handle links. This is a bit trickier.
-    # Link array is assumed to contain tuples as:
-    #     (link location, target location, inside)
-    for link in links:
-        # If the link points inside the 'target' directory and the target of the
-        # link will be deleted during cleanup, then remove the link.
-        if link[2] and (link[1] in delete_folders or link[1] in delete_files):
-            delete_links.append(link[0])
-        else:
-            for folder in delete_folders:
-                # If the link exists inside of or points into a folder that is
-                # going to be deleted, then remove the link.
-                if link[0].startswith(folder) or link[1].startswith(folder):
-                    delete_links.append(link[0])
-                    break
+    delete_links = _get_deletable_links(links, delete_folders, delete_files, fs, resolver)
+
+    # Keep track of how much was planned for the metrics.
+    metrics.record_plan('folder', delete_folders, sizes)
+    metrics.record_plan('file', delete_files, sizes)
+    metrics.record_plan('link', delete_links)
 
     # Print out lots of fun information if it's warranted.
     for folder in delete_folders:
@@ -252,7 +242,109 @@ def get_size_based_deletable_inventory(target_space, logger, target=None, oldest
     return delete_folders, delete_files, delete_links, accumulated_size
 
 
-def get_inventory(target, logger):
+def get_bounded_size_based_deletable_inventory(target_space, logger, target, oldest_first=True, overflow=False, max_records=100000, spill_dir=None, one_file_system=False, scan_workers=None, scan_start=1, fs=None):
+    """
+    Finds all of the items within a target that can be deleted based on a given
+    target amount of space to attempt to free up, without ever holding more
+    than 'max_records' folders and files in memory.
+
+    The inventory is streamed out of the target (see iter_inventory()) and
+    spilled to sorted run files on disk, which are then merged lazily in order
+    of age (or size) until enough space has been accumulated. This produces the
+    same plan as get_size_based_deletable_inventory(), but is meant for targets
+    with far too many items to inventory in memory.
+
+    'max_records' only bounds the inventory records being sorted. Memory use
+    still grows with the number of top-level entries (the target's listing is
+    read all at once, see iter_inventory()) and with the number of links, which
+    are all kept for working out which links to unmake.
+
+    :param target_space: the amount of space to attempt to clean up
+    :type  target_space: int
+    :param logger: a Management Tools logger object
+    :param target: the directory to clean out
+    :param oldest_first: whether to prefer deleting old itmes first; if set to
+                         False, then largest items will be deleted first
+    :param overflow: whether to allow deleting more than 'target_space'
+    :param max_records: the number of inventory records to hold in memory
+    :param spill_dir: where to write the sorted runs (defaults to the system's
+                      temporary directory)
+    :param one_file_system: whether to stay on the filesystem of 'target'
+    :param scan_workers: the most threads to scan with (see iter_inventory())
+    :param scan_start: the number of threads to start scanning with
+    :param fs: the filesystem to take the inventory from (see filesystem.py)
+    :return: list of folders, files, and links to be deleted and/or unmade and
+             the total amount of stuff deleted (in bytes)
+    """
+    logger.verbose("Getting bounded size-based deletable inventory:")
+
+    # Initialize lists to be returned.
+    delete_folders = []
+    delete_files   = []
+    links          = []
+    sizes          = {}
+
+    # Only needed by this planner, so don't slow down starting up for it.
+    import spill
+
+    # Links are resolved during the scan, and the same paths come up again when
+    # working out which links to unmake.
+    resolver = symlinks.LinkResolver(target, fs)
+
+    sorter = spill.SpillSorter(max_records, directory=spill_dir)
+    try:
+        # Records are sorted by age (or size, largest first). Ties are broken
+        # the same way as in the in-memory planner: folders before files, and
+        # then in the order they were found.
+        for sequence, (kind, item) in enumerate(iter_inventory(target, logger, one_file_system=one_file_system, scan_workers=scan_workers, scan_start=scan_start, fs=fs, resolver=resolver)):
+            if kind == 'link':
+                links.append(item)
+                continue
+            key  = item[1] if oldest_first else -item[2]
+            rank = 0 if kind == 'folder' else 1
+            sorter.add((key, rank, sequence, item[0], item[2]))
+
+        # Initialize an accumulated_size counter to keep track of how much stuff
+        # is going to be deleted.
+        accumulated_size = 0
+
+        # Build up the deletion lists, one item at a time.
+        for key, rank, sequence, path, size in sorter:
+            if accumulated_size >= target_space:
+                break
+            # If the item's size won't put us over the 'total_size' alotment,
+            # add it to the appropriate list of things to be deleted.
+            if overflow or size <= target_space - accumulated_size:
+                if rank == 0:
+                    delete_folders.append(path)
+                else:
+                    delete_files.append(path)
+                sizes[path] = size
+                accumulated_size += size
+                logger.verbose("    deleting: {}".format(path))
+    finally:
+        sorter.close()
+
+    delete_links = _get_deletable_links(links, delete_folders, delete_files, fs, resolver)
+
+    # Keep track of how much was planned for the metrics.
+    metrics.record_plan('folder', delete_folders, sizes)
+    metrics.record_plan('file', delete_files, sizes)
+    metrics.record_plan('link', delete_links)
+
+    # Print out lots of fun information if it's warranted.
+    for folder in delete_folders:
+        logger.debug("    Set to remove folder: {}".format(folder))
+    for file in delete_files:
+        logger.debug("    Set to remove file: {}".format(file))
+    for link in delete_links:
+        logger.debug("    Set to remove link: {}".format(link))
+
+    # Return the deletable inventory and accumulated size.
+    return delete_folders, delete_files, delete_links, accumulated_size
+
+
+def get_inventory(target, logger, one_file_system=False, triggers=None, scan_workers=None, scan_start=1, fs=None, resolver=None):
     """
     Given a target directory, finds all subitems within that directory and
     stores them in separate lists, ie folders, files, and links.
@@ -274,98 +366,307 @@ def get_inventory(target, logger):
         target path: the target that the link points to
         internal:    whether the target is in this inventory
 
+    If 'one_file_system' is set, the scan will not descend into directories
+    that live on a different device than 'target' (eg mounted network shares
+    or disk images). Top-level folders on other devices are left out of the
+    inventory entirely, and every refused crossing is logged.
+
+    If 'triggers' are given, the top level of each folder is checked for files
+    or directories matching any of the trigger names or glob patterns. When a
+    trigger is found, the folder's age is set to the most recent timestamp
+    among its matching triggers and the recursive walk of that folder is
+    skipped entirely. Such folders are recorded with a size of None (since it
+    was never measured), so they count as 0 bytes in reports and in the planned
+    and deleted byte metrics, and any links inside of them are not collected.
+    An inventory like that can't be used to plan by size (see
+    get_size_based_deletable_inventory()).
+
     :param target: directory to search for inventory
     :param logger: a Management Tools logger object
+    :param one_file_system: whether to stay on the filesystem of 'target'
+    :param triggers: a trigger file name or glob pattern, or a list of them
+    :param scan_workers: if given, measure the folders with up to this many
+                         threads (see iter_inventory())
+    :param scan_start: the number of threads to start scanning with
+    :param fs: the filesystem to take the inventory from (see filesystem.py);
+               defaults to the real one
+    :param resolver: the symlinks.LinkResolver to resolve links with; give one
+                     to share its work with planning afterwards (see
+                     get_date_based_deletable_inventory())
     :return: a tuple containing lists containing tuples describing the contents
              as (folders, files, links)
     """
-    if not os.path.isdir(target):
+    # Initialize lists to hold tuples.
+    inventory = {
+        'folder': [],
+        'file':   [],
+        'link':   []
+    }
+
+    for kind, item in iter_inventory(target, logger, one_file_system=one_file_system, triggers=triggers, scan_workers=scan_workers, scan_start=scan_start, fs=fs, resolver=resolver):
+        inventory[kind].append(item)
+
+    return inventory['folder'], inventory['file'], inventory['link']
+
+
+def iter_inventory(target, logger, one_file_system=False, triggers=None, scan_workers=None, scan_start=1, fs=None, resolver=None):
+    """
+    Walks through a target directory exactly like get_inventory(), but yields
+    each item as soon as it has been examined instead of collecting everything
+    into lists.
+
+    Memory use still grows with the number of top-level entries, though: the
+    listing of the target is read all at once (Python 2 has no way to read a
+    directory listing a piece at a time), and the paths of the top-level
+    folders are kept until each one has been walked. Nothing is kept for the
+    top-level files once they have been yielded.
+
+    Items are yielded as tuples of (kind, item) where 'kind' is one of 'folder',
+    'file', or 'link' and 'item' is a tuple as described in get_inventory().
+    Top-level links and files come first (in the order they are listed), and
+    then each folder (preceded by any links found inside of it).
+
+    If 'scan_workers' is given, the folders are measured by a pool of threads
+    instead (see scan.AdaptiveScanner), which tunes how many of them to use as
+    it goes. This can be a lot faster on volumes with high latency, like
+    network shares and RAID arrays. The items are the same either way, though
+    the links inside of each folder may come out in a different order.
+
+    :param target: directory to search for inventory
+    :param logger: a Management Tools logger object
+    :param one_file_system: whether to stay on the filesystem of 'target'
+    :param triggers: a trigger file name or glob pattern, or a list of them
+    :param scan_workers: the most threads to measure the folders with, or None
+                         to measure them one at a time in this thread
+    :param scan_start: the number of threads to start scanning with
+    :param fs: the filesystem to take the inventory from (see filesystem.py);
+               defaults to the real one
+    :param resolver: the symlinks.LinkResolver to resolve links with; give one
+                     to share its work with planning afterwards (see
+                     get_date_based_deletable_inventory())
+    :return: a generator of (kind, item) tuples
+    """
+    if fs is None:
+        fs = filesystem.OS
+
+    if not fs.isdir(target):
         raise ValueError("The target must be a valid, existing directory.")
 
+    # Remember which device the target lives on so we can tell when the walk
+    # would cross onto another filesystem.
+    device = fs.stat(target).st_dev if one_file_system else None
+
+    # Allow a single trigger to be given on its own.
+    if isinstance(triggers, basestring):
+        triggers = [triggers]
+
+    # Share the work of resolving links between all of the links found.
+    if resolver is None:
+        resolver = symlinks.LinkResolver(target, fs)
+
     logger.verbose("Getting top-level inventory:")
 
+    # Time the scan and count the entries visited for the metrics. Entries are
+    # tallied locally and only added to the metrics once per folder.
+    started = time.time()
+
     ##--------------------------------------------------------------------------
     ## Get top-level directory listings.
     ##--------------------------------------------------------------------------
 
-    # Initialize lists to hold tuples.
+    # Read the listing of the top directory. Files are measured as they come
+    # up, so that only the names in the listing and the paths of the folders
+    # (which are measured afterwards) are held in memory.
+    try:
+        names = fs.listdir(target)
+    except OSError:
+        names = []
+    metrics.inc('scan_entries', len(names))
+
     folders = []
-    files   = []
-    links   = []
-
-    # Walk through everything in just the top directory.
-    for path, subdirs, subfiles in os.walk(target):
-        for folder in subdirs:
-            folder = os.path.join(path, folder)
-            if os.path.islink(folder):
-                links.append(folder)
-                logger.verbose("    Found link: {}".format(folder))
-            else:
-                folders.append(folder)
-                logger.verbose("    Found folder: {}".format(folder))
-
-        for file in subfiles:
-            file = os.path.join(path, file)
-            if os.path.islink(file):
-                links.append(file)
-                logger.verbose("    Found link: {}".format(file))
+    for name in names:
+        path = os.path.join(target, name)
+        if fs.islink(path):
+            logger.verbose("    Found link: {}".format(path))
+            yield 'link', resolver.describe(path)
+        elif fs.isdir(path):
+            if device is not None and fs.lstat(path).st_dev != device:
+                logger.info("    Not crossing filesystem boundary: {}".format(path))
             else:
-                files.append(file)
-                logger.verbose("    Found file: {}".format(file))
-
-        # Prevent recursion to reduce time (we don't need everything indexed).
-        break
-
-    ##--------------------------------------------------------------------------
-    ## Get file information.
-    ##--------------------------------------------------------------------------
+                folders.append(path)
+                logger.verbose("    Found folder: {}".format(path))
+        else:
+            logger.verbose("    Found file: {}".format(path))
+            yield 'file', (path, fs.getmtime(path), fs.getsize(path))
 
-    # Get the age and size of each file.
-    files = [(file, os.path.getmtime(file), os.path.getsize(file)) for file in files]
+    # The listing is no longer needed.
+    names = None
 
     ##--------------------------------------------------------------------------
     ## Get folder information.
     ##--------------------------------------------------------------------------
 
+    if scan_workers is not None:
+        import scan
+        scanner = scan.AdaptiveScanner(
+            folders          = folders,
+            logger           = logger,
+            describe_link    = resolver.describe,
+            find_trigger_age = (lambda path, names: _find_trigger_age(path, names, triggers, fs)) if triggers else None,
+            device           = device,
+            workers          = scan_workers,
+            start            = scan_start,
+            fs               = fs,
+        )
+        for kind, item in scanner:
+            yield kind, item
+        # Every folder has been measured, so there's nothing left to walk.
+        folders = []
+
     # Get the age of each folder.
-    for i in range(len(folders)):
-        folder = folders[i]
-        age    = os.path.getmtime(folder)
-        size   = 0
+    for folder in folders:
+        age     = fs.getmtime(folder)
+        size    = 0
+        entries = 0
+
+        walk = fs.walk(folder)
+        if triggers:
+            # Look at the top level of the folder for any trigger files. This
+            # listing is the first step of the walk anyway, so it is reused
+            # below if no trigger is found.
+            first = next(walk, None)
+            if first is not None:
+                trigger_age = _find_trigger_age(first[0], first[1] + first[2], triggers, fs)
+                if trigger_age is not None:
+                    logger.verbose("    Found trigger in folder: {}".format(folder))
+                    metrics.inc('scan_entries', len(first[1]) + len(first[2]))
+                    yield 'folder', (folder, trigger_age, None)
+                    continue
+                walk = itertools.chain([first], walk)
+
+        for path, subdirs, subfiles in walk:
+            entries += len(subdirs) + len(subfiles)
+
+            # Prune any directories that are mount points for other devices so
+            # that fs.walk() never descends into them.
+            if device is not None:
+                for directory in list(subdirs):
+                    directory_path = os.path.join(path, directory)
+                    if not fs.islink(directory_path) and fs.lstat(directory_path).st_dev != device:
+                        logger.info("    Not crossing filesystem boundary: {}".format(directory_path))
+                        subdirs.remove(directory)
 
-        for path, subdirs, subfiles in os.walk(folder):
             for directory in subdirs:
                 directory = os.path.join(path, directory)
                 # If the modification time is more recent than that of the top
                 # directory, overwrite the directory's age with the file's.
-                directory_age = os.path.getmtime(directory)
+                directory_age = fs.getmtime(directory)
                 if directory_age > age:
                     age = directory_age
                 # Is the directory a link?
-                if os.path.islink(directory):
-                    links.append(directory)
+                if fs.islink(directory):
+                    yield 'link', resolver.describe(directory)
 
             for file in subfiles:
                 file = os.path.join(path, file)
                 file_age = 0
                 # Is the file a link?
-                if os.path.islink(file):
-                    links.append(file)
+                if fs.islink(file):
+                    yield 'link', resolver.describe(file)
                 else:
-                    size += os.path.getsize(file)
-                    file_age = os.path.getmtime(file)
+                    size += fs.getsize(file)
+                    file_age = fs.getmtime(file)
                 # If the modification time is more recent than that of the top
                 # directory, overwrite the directory's age with the file's.
                 if file_age > age:
                     age = file_age
 
-        folders[i] = (folder, age, size)
+        metrics.inc('scan_entries', entries)
+        yield 'folder', (folder, age, size)
 
-    ##--------------------------------------------------------------------------
-    ## Get link information.
-    ##--------------------------------------------------------------------------
+    metrics.inc('scan_duration_seconds', time.time() - started)
+
+
+def _get_deletable_links(links, delete_folders, delete_files, fs=None, resolver=None):
+    """
+    Finds the links that should be unmade along with a deletable inventory.
+
+    The targets of links are resolved paths, but the planned paths are under
+    the target as it was given, which may itself go through a link (eg /tmp on
+    macOS). Each planned path is looked for both ways.
+
+    :param links: an inventory of the links (see get_inventory())
+    :param delete_folders: the folders that are going to be deleted
+    :param delete_files: the files that are going to be deleted
+    :param fs: the filesystem the inventory was taken of (see filesystem.py)
+    :param resolver: the symlinks.LinkResolver the inventory was taken with, if
+                     there is one
+    :return: a list of links to be unmade
+    """
+    if not links:
+        return []
+
+    if resolver is None:
+        resolver = symlinks.LinkResolver('/', fs)
+    resolve  = lambda path: os.path.join(resolver.resolve(os.path.dirname(path)), os.path.basename(path))
 
-    # Determine whether each link connects to a point within the top directory.
-    links = [(link, os.path.realpath(link), os.path.realpath(link).startswith(target)) for link in links]
+    folders = set(delete_folders)
+    folders.update([resolve(folder) for folder in delete_folders])
+    deleted = set(delete_files)
+    deleted.update([resolve(item) for item in delete_files])
+    deleted.update(folders)
 
-    return folders, files, links
+    # Link array is assumed to contain tuples as:
+    #     (link location, target location, inside)
+    delete_links = []
+    for link in links:
+        # If the link points inside the 'target' directory and the target of the
+        # link will be deleted during cleanup, then remove the link.
+        if link[2] and link[1] in deleted:
+            delete_links.append(link[0])
+        # If the link exists inside of or points into a folder that is going to
+        # be deleted, then remove the link.
+        elif _is_within(link[0], folders) or _is_within(link[1], folders):
+            delete_links.append(link[0])
+    return delete_links
+
+
+def _is_within(path, folders):
+    """
+    :param path: an absolute path
+    :param folders: a set of folder paths
+    :return: whether 'path' is one of the folders or is somewhere inside of one
+    """
+    while True:
+        if path in folders:
+            return True
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+
+
+def _find_trigger_age(path, names, triggers, fs):
+    """
+    Finds the most recent modification timestamp among the entries in 'names'
+    that match any of the trigger names or glob patterns. Triggers may be files
+    or directories.
+
+    :param path: the directory that contains the entries
+    :param names: the names of the entries within 'path'
+    :param triggers: a list of trigger file names or glob patterns
+    :param fs: the filesystem the entries are on
+    :return: the most recent trigger timestamp, or None if there were no
+             trigger files
+    """
+    trigger_age = None
+    for name in names:
+        if any(fnmatch.fnmatch(name, trigger) for trigger in triggers):
+            try:
+                age = fs.getmtime(os.path.join(path, name))
+            except OSError:
+                # The trigger is a broken link or went away; ignore it.
+                continue
+            if trigger_age is None or age > trigger_age:
+                trigger_age = age
+    return trigger_age
@@ -1,54 +1,371 @@
+import collections
 import os
-import shutil
+import stat
 import sys
+import threading
+import time
 
+import filesystem
+import metrics
 
-def delete_links(links, logger):
+
+def delete_links(links, logger, journal=None, fs=None):
     """
     Unmake all of the links.
     
     :param links: A list containing paths to link objects to be deleted.
     :param logger: A Management Tools Logger object for handling output.
+    :param journal: A Journal to record each completed deletion in.
+    :param fs: The filesystem to delete from (defaults to the real one).
     """
+    if fs is None:
+        fs = filesystem.OS
+
     for link in links:
         try:
             logger.info("    Unlinking: {}".format(link))
-            os.unlink(link)
+            fs.unlink(link)
+            metrics.record_deleted('link', link)
+            if journal is not None:
+                journal.complete('link', link)
         except IOError as (errno, strerror):
+            metrics.inc('errors', kind='link')
             logger.error("I/O Error({}): {}".format(errno, strerror))
         except:
+            metrics.inc('errors', kind='link')
             logger.error("{}: {}".format(sys.exc_info()[0].__name__, sys.exc_info()[1]))
 
 
-def delete_files(files, logger):
+def delete_files(files, logger, journal=None, fs=None):
     """
     Remove all of the files.
     
     :param files: A list containing paths to files to be deleted.
     :param logger: A Management Tools Logger object for handling output.
+    :param journal: A Journal to record each completed deletion in.
+    :param fs: The filesystem to delete from (defaults to the real one).
     """
+    if fs is None:
+        fs = filesystem.OS
+
     for file in files:
         try:
             logger.info("    Deleting File: {}".format(file))
-            os.remove(file)
+            fs.remove(file)
+            metrics.record_deleted('file', file)
+            if journal is not None:
+                journal.complete('file', file)
         except IOError as (errno, strerror):
+            metrics.inc('errors', kind='file')
             logger.error("I/O Error({}): {}".format(errno, strerror))
         except:
+            metrics.inc('errors', kind='file')
             logger.error("{}: {}".format(sys.exc_info()[0].__name__, sys.exc_info()[1]))
 
 
-def delete_folders(folders, logger):
+def delete_folders(folders, logger, one_file_system=False, journal=None, workers=1, fs=None):
     """
     Recursively delete the folders.
     
     :param folders: A list containing folders to be deleted.
     :param logger: A Management Tools Logger object for handling output.
+    :param one_file_system: If True, never recurse onto a different device
+                            than the one the folder's parent lives on.
+    :param journal: A Journal to record each completed deletion in.
+    :param workers: The number of threads to remove each folder's contents with.
+    :param fs: The filesystem to delete from (defaults to the real one).
     """
+    if fs is None:
+        fs = filesystem.OS
+
     for folder in folders:
         try:
             logger.info("    Removing Directory: {}".format(folder))
-            shutil.rmtree(folder)
+            if workers > 1:
+                device = fs.lstat(os.path.dirname(folder)).st_dev if one_file_system else None
+                if not remove_tree_parallel(folder, logger, workers, device=device, fs=fs):
+                    logger.error("Could not completely remove {}".format(folder))
+                    metrics.inc('errors', kind='folder')
+                    continue
+            elif one_file_system:
+                device = fs.lstat(os.path.dirname(folder)).st_dev
+                if not remove_tree_one_fs(folder, device, logger, fs=fs):
+                    logger.error("Could not completely remove {} without crossing filesystems.".format(folder))
+                    metrics.inc('errors', kind='folder')
+                    continue
+            else:
+                fs.rmtree(folder)
+            metrics.record_deleted('folder', folder)
+            if journal is not None:
+                journal.complete('folder', folder)
         except IOError as (errno, strerror):
+            metrics.inc('errors', kind='folder')
             logger.error("I/O Error({}): {}".format(errno, strerror))
         except:
+            metrics.inc('errors', kind='folder')
             logger.error("{}: {}".format(sys.exc_info()[0].__name__, sys.exc_info()[1]))
+
+
+def sort_by_locality(paths, fs=None):
+    """
+    Reorders a batch of paths so that items are deleted in on-disk order rather
+    than in the order they were planned in. Items are grouped by device and by
+    the inode of their parent directory, and then sorted by their own inode
+    number, which keeps directory and inode table updates close together on
+    spinning disks. Items that can no longer be found are left at the end in
+    their original order.
+
+    :param paths: A list of paths to be deleted.
+    :param fs: The filesystem the paths are on (defaults to the real one).
+    :return: A new list containing the same paths.
+    """
+    if fs is None:
+        fs = filesystem.OS
+
+    parents = {}
+
+    def locality(path):
+        try:
+            info = fs.lstat(path)
+        except OSError:
+            return 1, 0, 0, 0
+        parent = os.path.dirname(path)
+        if parent not in parents:
+            try:
+                parents[parent] = fs.lstat(parent).st_ino
+            except OSError:
+                parents[parent] = 0
+        return 0, info.st_dev, parents[parent], info.st_ino
+
+    return sorted(paths, key=locality)
+
+
+def remove_tree_one_fs(folder, device, logger, fs=None):
+    """
+    Recursively delete a folder without ever crossing onto another device.
+    Any directory found on a different device is left alone (and logged), which
+    means its parent directories cannot be removed either.
+
+    :param folder: The folder to be deleted.
+    :param device: The device number (st_dev) that deletion is confined to.
+    :param logger: A Management Tools Logger object for handling output.
+    :param fs: The filesystem to delete from (defaults to the real one).
+    :return: True if the folder was removed entirely, False otherwise.
+    """
+    if fs is None:
+        fs = filesystem.OS
+
+    if fs.lstat(folder).st_dev != device:
+        logger.error("Refusing to cross filesystem boundary: {}".format(folder))
+        return False
+
+    complete = True
+    for name in fs.listdir(folder):
+        path = os.path.join(folder, name)
+        if fs.isdir(path) and not fs.islink(path):
+            if not remove_tree_one_fs(path, device, logger, fs):
+                complete = False
+        else:
+            fs.remove(path)
+
+    if complete:
+        fs.rmdir(folder)
+    return complete
+
+
+def remove_tree_parallel(folder, logger, workers, device=None, progress_every=10000, fs=None):
+    """
+    Recursively delete a single folder using several threads at once. This is
+    meant for very large trees, where shutil.rmtree() would be stuck working
+    through one directory at a time.
+
+    Each thread keeps its own queue of directories to empty, working on the
+    most recently found one first. A thread that runs out of work steals the
+    oldest directory from another thread's queue, which tends to be the root of
+    a large, untouched subtree. A directory is only removed once all of its
+    subdirectories have been removed, at which point its parent is checked.
+
+    Anything that cannot be removed (including directories on another device,
+    if 'device' is given) is logged and left in place along with all of its
+    parent directories.
+
+    :param folder: The folder to be deleted.
+    :param logger: A Management Tools Logger object for handling output.
+    :param workers: The number of threads to use.
+    :param device: If given, the device number (st_dev) deletion is confined to.
+    :param progress_every: How many removed entries to log progress after.
+    :param fs: The filesystem to delete from (defaults to the real one).
+    :return: True if the folder was removed entirely, False otherwise.
+    """
+    if fs is None:
+        fs = filesystem.OS
+
+    remover = _ParallelRemover(folder, logger, workers, device, progress_every, fs)
+    return remover.run()
+
+
+class _ParallelRemover(object):
+    """
+    The shared state for remove_tree_parallel().
+    """
+
+    def __init__(self, folder, logger, workers, device, progress_every, fs):
+        self.folder         = folder
+        self.fs             = fs
+        self.logger         = logger
+        self.device         = device
+        self.progress_every = progress_every
+        self.queues         = [collections.deque() for _ in range(max(workers, 1))]
+        self.lock           = threading.Lock()
+        # The number of subdirectories each directory is still waiting on, and
+        # the parent of each directory (for when it's finally removed).
+        self.remaining      = {}
+        self.parents        = {}
+        self.failed         = set()
+        # Directories that are queued or being emptied right now.
+        self.outstanding    = 1
+        self.removed        = 0
+        self.complete       = None
+
+    def run(self):
+        """
+        :return: True if the folder was removed entirely, False otherwise.
+        """
+        if self.device is not None and self.fs.lstat(self.folder).st_dev != self.device:
+            self.logger.error("Refusing to cross filesystem boundary: {}".format(self.folder))
+            return False
+
+        self.queues[0].append(self.folder)
+        threads = [threading.Thread(target=self._work, args=(index,)) for index in range(len(self.queues))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.logger.verbose("    Removed {} entries from {}".format(self.removed, self.folder))
+        return bool(self.complete)
+
+    def _work(self, index):
+        """
+        The main loop of a single thread.
+        """
+        own = self.queues[index]
+        while True:
+            try:
+                directory = own.pop()
+            except IndexError:
+                directory = self._steal(index)
+            if directory is None:
+                with self.lock:
+                    if self.outstanding == 0:
+                        return
+                time.sleep(0.001)
+                continue
+            self._empty(directory, own)
+
+    def _steal(self, index):
+        """
+        :return: the oldest directory from another thread's queue, or None if
+                 there is nothing to steal
+        """
+        count = len(self.queues)
+        for offset in range(1, count):
+            try:
+                return self.queues[(index + offset) % count].popleft()
+            except IndexError:
+                continue
+        return None
+
+    def _empty(self, directory, own):
+        """
+        Removes everything in a directory except its subdirectories, which are
+        queued up for this thread instead.
+        """
+        subdirs = []
+        removed = 0
+        failed  = False
+        try:
+            names = self.fs.listdir(directory)
+        except OSError as e:
+            self.logger.error("{}: {}".format(e.strerror, directory))
+            names  = []
+            failed = True
+
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                info = self.fs.lstat(path)
+                if stat.S_ISDIR(info.st_mode):
+                    if self.device is not None and info.st_dev != self.device:
+                        self.logger.error("Refusing to cross filesystem boundary: {}".format(path))
+                        failed = True
+                    else:
+                        subdirs.append(path)
+                    continue
+                self.fs.remove(path)
+                removed += 1
+            except OSError as e:
+                self.logger.error("{}: {}".format(e.strerror, path))
+                failed = True
+
+        with self.lock:
+            self._count(removed)
+            if failed:
+                self.failed.add(directory)
+            self.remaining[directory] = len(subdirs)
+            for subdir in subdirs:
+                self.parents[subdir] = directory
+            self.outstanding += len(subdirs) - 1
+
+        if subdirs:
+            # Queue the subdirectories only once they're accounted for above,
+            # so no other thread can finish one before its parent knows of it.
+            own.extend(subdirs)
+        else:
+            self._finish(directory)
+
+    def _finish(self, directory):
+        """
+        Removes a directory whose subdirectories are all gone, then works up
+        through any parents that were only waiting on it. Only one thread can
+        see a directory's last subdirectory go, so only one thread ever tries
+        to remove it.
+        """
+        while True:
+            with self.lock:
+                failed = directory in self.failed
+                self.failed.discard(directory)
+
+            succeeded = False
+            if not failed:
+                try:
+                    self.fs.rmdir(directory)
+                    succeeded = True
+                except OSError as e:
+                    self.logger.error("{}: {}".format(e.strerror, directory))
+
+            with self.lock:
+                if succeeded:
+                    self._count(1)
+                del self.remaining[directory]
+                parent = self.parents.pop(directory, None)
+                if parent is None:
+                    self.complete = succeeded
+                    return
+                if not succeeded:
+                    self.failed.add(parent)
+                self.remaining[parent] -= 1
+                if self.remaining[parent] > 0:
+                    return
+            directory = parent
+
+    def _count(self, removed):
+        """
+        Keeps track of how many entries have been removed and logs progress
+        every so often. Must be called with the lock held.
+        """
+        before        = self.removed // self.progress_every
+        self.removed += removed
+        if self.removed // self.progress_every > before:
+            self.logger.verbose("    Removed {} entries from {}".format(self.removed, self.folder))
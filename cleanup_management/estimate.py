@@ -0,0 +1,285 @@
+import math
+import os
+import stat
+import time
+
+import filesystem
+import report
+
+
+# The number of standard errors on either side of an estimate that its
+# confidence bounds cover (1.96 gives roughly 95% confidence).
+Z_SCORE = 1.96
+
+# The most entries of any one directory that are examined on a single probe.
+# Larger directories are sampled and their contents scaled up accordingly.
+MAX_SAMPLE = 64
+
+# The fewest probes taken of each folder (budget permitting), so that every
+# folder's estimate has a spread to compute confidence bounds from.
+MIN_PROBES = 2
+
+
+class Estimate(object):
+    """
+    The estimated size and age of a single top-level item. These are kept
+    separate from inventory tuples (see analysis.get_inventory()) on purpose so
+    that an estimate can never be handed to one of the planners by mistake;
+    estimates are only ever meant to be looked at.
+
+    An item the budget ran out before has a 'size' (and 'error') of None.
+
+    :ivar path: the path to the item
+    :ivar size: the estimated size of the item, in bytes, or None if unknown
+    :ivar error: the distance from 'size' to either confidence bound
+    :ivar newest: the most recent modification time that was seen (or None);
+                  the item's real age can only be this new or newer
+    :ivar probes: the number of random descents that were averaged (0 means
+                  the item was measured exactly, or not at all)
+    """
+
+    def __init__(self, path, size, error, newest, probes):
+        self.path   = path
+        self.size   = size
+        self.error  = error
+        self.newest = newest
+        self.probes = probes
+
+    @property
+    def known(self):
+        return self.size is not None
+
+    @property
+    def lower(self):
+        return max(self.size - self.error, 0) if self.known else None
+
+    @property
+    def upper(self):
+        return self.size + self.error if self.known else None
+
+
+def get_estimates(target, logger, budget=100000, one_file_system=False, seed=None, fs=None):
+    """
+    Estimates the size and age of every top-level item in a target without
+    walking all of it, using no more than 'budget' stat calls in total (listing
+    a directory counts as one).
+
+    Top-level files are measured exactly. Each folder gets an equal share of
+    whatever is left of the budget and is probed repeatedly with Knuth's
+    random-descent estimator: starting at the folder, one subdirectory is
+    picked at random at each level until a leaf is reached, and the size found
+    at each level is multiplied by the product of the branching factors above
+    it. Every probe is an unbiased estimate of the folder's total size, so the
+    mean of the probes is the estimate and their spread gives the confidence
+    bounds. Trees with a few huge branches among many small ones have a large
+    spread, and the bounds are only a rough guide after a handful of probes.
+
+    The age of a folder can't be extrapolated this way, so only the most recent
+    modification time seen along the way is reported.
+
+    The budget is a hard limit. Each folder gets MIN_PROBES probes if they fit,
+    and a probe that would go over the budget is cut short and thrown away (a
+    partial descent would underestimate). Items that the budget ran out before
+    (including top-level entries that couldn't even be looked at) are returned
+    with an unknown size.
+
+    :param target: the directory to estimate the contents of
+    :param logger: a Management Tools logger object
+    :param budget: the number of stat calls to spend
+    :param one_file_system: whether to stay on the filesystem of 'target'
+    :param seed: a seed for the random descents, to get repeatable estimates
+    :param fs: the filesystem to look at (see filesystem.py)
+    :return: a list of Estimate objects, one per top-level folder or file
+    """
+    # Only needed in this mode, so don't slow down starting up for it.
+    import random
+
+    if fs is None:
+        fs = filesystem.OS
+
+    if not fs.isdir(target):
+        raise ValueError("The target must be a valid, existing directory.")
+
+    rng    = random.Random(seed)
+    device = fs.stat(target).st_dev if one_file_system else None
+
+    logger.verbose("Estimating top-level inventory:")
+
+    estimates = []
+    folders   = []
+    spent     = 1
+    for name in fs.listdir(target):
+        path = os.path.join(target, name)
+        if spent >= budget:
+            estimates.append(Estimate(path, None, None, None, 0))
+            continue
+        try:
+            info = fs.lstat(path)
+        except OSError:
+            continue
+        spent += 1
+        if stat.S_ISLNK(info.st_mode):
+            continue
+        elif stat.S_ISDIR(info.st_mode):
+            if device is not None and info.st_dev != device:
+                logger.info("    Not crossing filesystem boundary: {}".format(path))
+            else:
+                folders.append((path, info.st_mtime))
+        else:
+            estimates.append(Estimate(path, info.st_size, 0, info.st_mtime, 0))
+
+    for index, (folder, newest) in enumerate(folders):
+        # Share out whatever is left of the budget evenly among the folders
+        # that haven't been looked at yet.
+        allowance = (budget - spent) // (len(folders) - index)
+        samples   = []
+        used      = 0
+        while spent + used < budget and (len(samples) < MIN_PROBES or used < allowance):
+            size, seen, stats = _probe(folder, device, rng, fs, budget - spent - used)
+            newest = max(newest, seen)
+            used  += stats
+            if size is None:
+                break
+            samples.append(size)
+        spent += used
+
+        if not samples:
+            estimates.append(Estimate(folder, None, None, newest, 0))
+            logger.verbose("    Out of budget for folder: {}".format(folder))
+            continue
+
+        mean  = sum(samples) / len(samples)
+        error = 0
+        if len(samples) > 1:
+            variance = sum((sample - mean) ** 2 for sample in samples) / (len(samples) - 1)
+            error    = Z_SCORE * math.sqrt(variance / len(samples))
+        estimates.append(Estimate(folder, mean, error, newest, len(samples)))
+        logger.verbose("    Estimated folder: {} ({} probes)".format(folder, len(samples)))
+
+    logger.verbose("Spent {} stat calls estimating {} items.".format(spent, len(estimates)))
+    return estimates
+
+
+def log_estimates(estimates, logger, now=None, thresholds=None):
+    """
+    Outputs the estimated size of each item, the estimated total, and roughly
+    how much data each keep-after threshold would free up. Nothing is deleted.
+
+    Since an item can be newer than the newest timestamp seen while estimating
+    it, the amounts given for each threshold are upper limits. Items of unknown
+    size are listed, but left out of the totals.
+
+    :param estimates: a list of Estimate objects (see get_estimates())
+    :param logger: a Management Tools logger object
+    :param now: the Unix timestamp that ages are measured from
+    :param thresholds: a list of ages (in days) to evaluate
+    """
+    if now is None:
+        now = time.time()
+    if thresholds is None:
+        thresholds = report.DEFAULT_THRESHOLDS
+
+    known   = [item for item in estimates if item.known]
+    unknown = [item for item in estimates if not item.known]
+
+    logger.info("Estimated sizes:")
+    for item in sorted(known, key=lambda item: item.size, reverse=True):
+        logger.info("    {:>10} ({} to {}) {}".format(
+            report.format_bytes(item.size), report.format_bytes(item.lower), report.format_bytes(item.upper), item.path
+        ))
+    for item in unknown:
+        logger.info("    {:>10} {}".format('unknown', item.path))
+
+    size, error = _combine(known)
+    logger.info("Estimated total: {} ({} to {}) in {} items".format(
+        report.format_bytes(size), report.format_bytes(max(size - error, 0)), report.format_bytes(size + error), len(known)
+    ))
+    if unknown:
+        logger.info("{} items could not be estimated within the budget and are left out of the totals.".format(len(unknown)))
+
+    logger.info("Space freed by keep-after (at most):")
+    for days in sorted(thresholds):
+        keep_after = now - days * 86400
+        items      = [item for item in known if item.newest < keep_after]
+        size, error = _combine(items)
+        logger.info("    {:>5} days {:>10} items {:>12} ({} to {})".format(
+            days, len(items), report.format_bytes(size), report.format_bytes(max(size - error, 0)), report.format_bytes(size + error)
+        ))
+
+
+def _probe(folder, device, rng, fs, limit):
+    """
+    Takes a single random path from 'folder' down to a leaf directory.
+
+    :param folder: the folder to estimate
+    :param device: the device to stay on, or None
+    :param rng: a random.Random object
+    :param fs: the filesystem to look at
+    :param limit: the most stat calls the probe may make
+    :return: an estimate of the total size of the files in 'folder' (or None
+             if the probe ran into 'limit' before reaching a leaf), the most
+             recent modification time seen, and the number of stat calls made
+    """
+    size   = 0.0
+    weight = 1.0
+    newest = 0
+    stats  = 0
+    path   = folder
+    while path is not None:
+        if stats >= limit:
+            return None, newest, stats
+        # A failed listing still costs a call (and must, or probing a folder
+        # that can't be read would never use up its share of the budget).
+        stats += 1
+        try:
+            names = fs.listdir(path)
+        except OSError:
+            break
+
+        # Examine a random sample of very large directories, and scale up what
+        # was found in the sample to the whole directory.
+        if len(names) > MAX_SAMPLE:
+            scale = float(len(names)) / MAX_SAMPLE
+            names = rng.sample(names, MAX_SAMPLE)
+        else:
+            scale = 1.0
+
+        here    = 0
+        subdirs = []
+        for name in names:
+            if stats >= limit:
+                return None, newest, stats
+            child = os.path.join(path, name)
+            try:
+                info = fs.lstat(child)
+            except OSError:
+                continue
+            stats += 1
+            if info.st_mtime > newest:
+                newest = info.st_mtime
+            if stat.S_ISDIR(info.st_mode):
+                if device is None or info.st_dev == device:
+                    subdirs.append(child)
+            elif not stat.S_ISLNK(info.st_mode):
+                here += info.st_size
+
+        # Everything at this level stands in for all of the directories at the
+        # same depth that weren't visited.
+        size += weight * scale * here
+        if not subdirs:
+            break
+        weight *= scale * len(subdirs)
+        path    = rng.choice(subdirs)
+
+    return size, newest, stats
+
+
+def _combine(estimates):
+    """
+    :param estimates: a list of Estimate objects
+    :return: the combined size of the estimates, and the distance to the
+             combined confidence bounds (treating the estimates as independent)
+    """
+    size  = sum(item.size for item in estimates)
+    error = math.sqrt(sum(item.error ** 2 for item in estimates))
+    return size, error
@@ -0,0 +1,342 @@
+import errno
+import os
+import shutil
+import stat
+
+
+class OSFilesystem(object):
+    """
+    The real filesystem. Every operation is the matching function from 'os',
+    'os.path', or 'shutil', bound directly so that going through this class
+    costs nothing extra.
+    """
+
+    def __init__(self):
+        self.walk     = os.walk
+        self.listdir  = os.listdir
+        self.stat     = os.stat
+        self.lstat    = os.lstat
+        self.isdir    = os.path.isdir
+        self.islink   = os.path.islink
+        self.lexists  = os.path.lexists
+        self.getmtime = os.path.getmtime
+        self.getsize  = os.path.getsize
+        self.readlink = os.readlink
+        self.remove   = os.remove
+        self.unlink   = os.unlink
+        self.rmdir    = os.rmdir
+        self.rmtree   = shutil.rmtree
+
+
+# The filesystem used when no other is given.
+OS = OSFilesystem()
+
+
+class MemoryStat(object):
+    """
+    The subset of a stat result that a MemoryFilesystem provides.
+    """
+
+    def __init__(self, st_mode, st_ino, st_size, st_mtime, st_dev=1):
+        self.st_mode  = st_mode
+        self.st_ino   = st_ino
+        self.st_size  = st_size
+        self.st_mtime = st_mtime
+        self.st_dev   = st_dev
+
+
+class MemoryFilesystem(object):
+    """
+    A filesystem that only exists in memory, with the same interface as
+    OSFilesystem. It's meant for exercising the planning and link resolution
+    code at a scale that would be impractical to build on disk, and for
+    getting repeatable numbers out of it.
+
+    Trees are built with mkdir(), makedirs(), add_file(), and symlink().
+    Timestamps are whatever they were created with; unlike a real filesystem,
+    adding or removing items does not update the parent directory's mtime.
+    Directory listings are returned in sorted order.
+
+    Every directory that is looked up is remembered by path, so looking up an
+    entry only takes a single step from its (already known) parent. Removing
+    or replacing anything forgets all of them.
+    """
+
+    def __init__(self):
+        self.inodes      = 1
+        self.root        = self._node(stat.S_IFDIR, 0, 0)
+        self.directories = {}
+
+    ##--------------------------------------------------------------------------
+    ## Building trees.
+    ##--------------------------------------------------------------------------
+
+    def mkdir(self, path, mtime=0):
+        """
+        Creates a single directory.
+        """
+        parent, name = self._parent(path)
+        if name in parent['children']:
+            raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+        parent['children'][name] = self._node(stat.S_IFDIR, 0, mtime)
+
+    def makedirs(self, path, mtime=0):
+        """
+        Creates a directory along with any missing parents.
+        """
+        node = self.root
+        for name in self._split(path):
+            if name not in node['children']:
+                node['children'][name] = self._node(stat.S_IFDIR, 0, mtime)
+            node = node['children'][name]
+            if not stat.S_ISDIR(node['mode']):
+                raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+
+    def add_file(self, path, size=0, mtime=0):
+        """
+        Creates (or replaces) a regular file.
+        """
+        parent, name = self._parent(path)
+        if name in parent['children']:
+            self.directories.clear()
+        parent['children'][name] = self._node(stat.S_IFREG, size, mtime)
+
+    def symlink(self, target, path, mtime=0):
+        """
+        Creates a symbolic link at 'path' pointing to 'target'.
+        """
+        parent, name = self._parent(path)
+        if name in parent['children']:
+            raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+        node = self._node(stat.S_IFLNK, len(target), mtime)
+        node['target'] = target
+        parent['children'][name] = node
+
+    ##--------------------------------------------------------------------------
+    ## The OSFilesystem interface.
+    ##--------------------------------------------------------------------------
+
+    def walk(self, top):
+        """
+        Like os.walk() (top-down, not following links, ignoring errors).
+        Changes made to the list of directories are honored.
+        """
+        stack = [top]
+        while stack:
+            top = stack.pop()
+            try:
+                names = self.listdir(top)
+            except OSError:
+                continue
+            dirs    = []
+            nondirs = []
+            for name in names:
+                if self.isdir(os.path.join(top, name)):
+                    dirs.append(name)
+                else:
+                    nondirs.append(name)
+            yield top, dirs, nondirs
+            for name in reversed(dirs):
+                path = os.path.join(top, name)
+                if not self.islink(path):
+                    stack.append(path)
+
+    def listdir(self, path):
+        node = self._lookup(path)
+        if not stat.S_ISDIR(node['mode']):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        return sorted(node['children'])
+
+    def stat(self, path):
+        return self._stat(self._lookup(path))
+
+    def lstat(self, path):
+        return self._stat(self._lookup(path, follow=False))
+
+    def isdir(self, path):
+        try:
+            return stat.S_ISDIR(self._lookup(path)['mode'])
+        except OSError:
+            return False
+
+    def islink(self, path):
+        try:
+            return stat.S_ISLNK(self._lookup(path, follow=False)['mode'])
+        except OSError:
+            return False
+
+    def lexists(self, path):
+        try:
+            self._lookup(path, follow=False)
+            return True
+        except OSError:
+            return False
+
+    def getmtime(self, path):
+        return self._lookup(path)['mtime']
+
+    def getsize(self, path):
+        return self._lookup(path)['size']
+
+    def readlink(self, path):
+        node = self._lookup(path, follow=False)
+        if not stat.S_ISLNK(node['mode']):
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), path)
+        return node['target']
+
+    def remove(self, path):
+        parent, name = self._parent(path)
+        node = parent['children'].get(name)
+        if node is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if stat.S_ISDIR(node['mode']):
+            raise OSError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+        del parent['children'][name]
+        self.directories.clear()
+
+    unlink = remove
+
+    def rmdir(self, path):
+        parent, name = self._parent(path)
+        node = parent['children'].get(name)
+        if node is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if not stat.S_ISDIR(node['mode']):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        if node['children']:
+            raise OSError(errno.ENOTEMPTY, os.strerror(errno.ENOTEMPTY), path)
+        del parent['children'][name]
+        self.directories.clear()
+
+    def rmtree(self, path):
+        """
+        Like shutil.rmtree(), without an error handler.
+        """
+        if self.islink(path):
+            raise OSError("Cannot call rmtree on a symbolic link")
+        parent, name = self._parent(path)
+        node = parent['children'].get(name)
+        if node is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if not stat.S_ISDIR(node['mode']):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        del parent['children'][name]
+        self.directories.clear()
+
+    ##--------------------------------------------------------------------------
+    ## Internals.
+    ##--------------------------------------------------------------------------
+
+    def _node(self, mode, size, mtime):
+        self.inodes += 1
+        node = {'mode': mode, 'ino': self.inodes, 'size': size, 'mtime': mtime}
+        if stat.S_ISDIR(mode):
+            node['children'] = {}
+        return node
+
+    def _stat(self, node):
+        return MemoryStat(node['mode'] | 0o755, node['ino'], node['size'], node['mtime'])
+
+    def _split(self, path):
+        """
+        :return: the components of an absolute path, with '.' and '..' handled
+                 lexically (as os.path.abspath() would)
+        """
+        if path.startswith('/') and '/.' not in path:
+            # Nothing to normalize, other than repeated slashes.
+            return [name for name in path.split('/') if name]
+        return [name for name in os.path.abspath(path).split('/') if name]
+
+    def _parent(self, path):
+        """
+        :return: the (resolved) parent directory node of 'path', and the last
+                 component of 'path'
+        """
+        names = self._split(path)
+        if not names:
+            raise OSError(errno.EBUSY, os.strerror(errno.EBUSY), path)
+        parent = self._lookup('/' + '/'.join(names[:-1]))
+        if not stat.S_ISDIR(parent['mode']):
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        return parent, names[-1]
+
+    def _lookup(self, path, follow=True):
+        """
+        :return: the node at 'path', following links along the way (and at the
+                 end too, if 'follow' is set)
+        """
+        return self._locate(path, follow)[0]
+
+    def _locate(self, path, follow=True):
+        """
+        :return: the node at 'path' (as for _lookup()), and its resolved path
+        """
+        known = self.directories.get(path)
+        if known is not None:
+            return known
+
+        if (not path.startswith('/') or '//' in path or path.endswith(('/', '/.', '/..')) or
+                '/./' in path or '/../' in path):
+            # Only clean, absolute paths are split up below.
+            clean = '/' + '/'.join(self._split(path))
+            if clean == '/':
+                return self.root, '/'
+            try:
+                return self._locate(clean, follow)
+            except OSError as e:
+                raise OSError(e.errno, e.strerror, path)
+
+        parent_path, _, name = path.rpartition('/')
+        try:
+            parent, where = self._locate(parent_path or '/')
+        except OSError as e:
+            raise OSError(e.errno, e.strerror, path)
+        # Only directories have children (and only links have targets).
+        if 'children' not in parent:
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+
+        node = parent['children'].get(name)
+        if node is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if follow and 'target' in node:
+            resolved, remaining = self._resolve(where, [name], 0)
+            if remaining:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            return self._locate(resolved, follow=False)[0], resolved
+
+        where = where + name if where == '/' else where + '/' + name
+        if 'children' in node:
+            # Directories are the same whether links are followed or not.
+            self.directories[path] = (node, where)
+        return node, where
+
+    def _resolve(self, where, names, depth):
+        """
+        Resolves 'names' one at a time starting from the directory 'where',
+        following every link.
+
+        :return: the resolved path, and any components that could not be found
+        """
+        if depth > 40:
+            raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), where)
+        for index, name in enumerate(names):
+            if name == '..':
+                where = os.path.dirname(where)
+                continue
+            if name == '.':
+                continue
+            try:
+                node = self._lookup(where)['children'].get(name)
+            except (OSError, KeyError):
+                node = None
+            if node is None:
+                return where, names[index:]
+            if stat.S_ISLNK(node['mode']):
+                target = node['target']
+                start  = '/' if target.startswith('/') else where
+                where, remaining = self._resolve(start, [n for n in target.split('/') if n], depth + 1)
+                if remaining:
+                    return where, remaining + names[index + 1:]
+            else:
+                where = os.path.join(where, name)
+        return where, []
@@ -0,0 +1,189 @@
+import os
+import time
+
+
+# The kinds of items that can be recorded, in the order they are deleted.
+KINDS = ['link', 'file', 'folder']
+
+# The line that follows a completely written plan.
+PLAN_DONE = 'plan done\n'
+
+
+class Journal(object):
+    """
+    An append-only record of a cleanup run. The full plan is written (and
+    synced to disk) before anything is deleted, and a completion marker is
+    appended after each item is removed. If the run is killed partway through,
+    load_pending() recovers whatever is left to do.
+
+    Each line of the journal looks like:
+        <O|P|D> <kind> <escaped path>
+    where 'P' marks a plan entry and 'D' marks a completed one. 'O' lines come
+    first and hold the options the plan has to be carried out with (with the
+    option's name in place of the kind, and its value in place of the path).
+    The last plan entry is followed by a 'plan done' line, so that a plan which
+    was cut short can't be mistaken for a whole one.
+
+    Completion markers are buffered and only synced to disk every
+    'sync_interval' seconds (or every 'sync_every' entries, whichever comes
+    first) so that journaling does not slow the deletions down. At worst, a
+    crash causes a few already-deleted items to be attempted again.
+    """
+
+    def __init__(self, path, resume=False, sync_interval=1.0, sync_every=1000):
+        """
+        :param path: the location of the journal file
+        :param resume: whether to append to an existing journal instead of
+                       starting a new one
+        :param sync_interval: the number of seconds between syncs to disk
+        :param sync_every: the number of entries after which to sync regardless
+        """
+        self.path          = path
+        self.sync_interval = sync_interval
+        self.sync_every    = sync_every
+        self.pending       = 0
+        self.last_sync     = time.time()
+        self.handle        = open(path, 'a' if resume else 'w')
+
+        # If the previous run died partway through writing a line, cut that
+        # line off. Just ending it instead would turn whatever part of the path
+        # made it to disk into a valid (and wrong) entry.
+        if resume:
+            os.ftruncate(self.handle.fileno(), _get_complete_length(path))
+
+    def write_plan(self, links, files, folders, options=None):
+        """
+        Records every item that is going to be deleted and syncs the journal.
+
+        :param links: a list of links to be unmade
+        :param files: a list of files to be deleted
+        :param folders: a list of folders to be deleted
+        :param options: a dictionary of the (string) options that deleting has
+                        to be done with, eg {'one_file_system': 'True'}
+        """
+        for name, value in sorted((options or {}).items()):
+            self.handle.write(_format_entry('O', name, value))
+        for kind, paths in zip(KINDS, [links, files, folders]):
+            for path in paths:
+                self.handle.write(_format_entry('P', kind, path))
+        self.handle.write(PLAN_DONE)
+        self.sync()
+
+    def complete(self, kind, path):
+        """
+        Records that an item has been deleted. The entry is synced to disk
+        along with the rest of its batch.
+
+        :param kind: one of 'link', 'file', or 'folder'
+        :param path: the path of the deleted item
+        """
+        self.handle.write(_format_entry('D', kind, path))
+        self.pending += 1
+        if self.pending >= self.sync_every or time.time() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """
+        Forces all of the buffered entries out to disk.
+        """
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.pending   = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        """
+        Syncs any remaining entries and closes the journal.
+        """
+        if not self.handle.closed:
+            self.sync()
+            self.handle.close()
+
+
+def load_pending(path):
+    """
+    Reads a journal and finds all of the planned items that were not marked as
+    completed, in the order they were planned.
+
+    A partially-written last line (from a run that was killed mid-write) is
+    ignored.
+
+    :param path: the location of the journal file
+    :return: lists of links, files, and folders that still need to be deleted
+    :raises ValueError: if the plan was never completely written out
+    """
+    planned  = []
+    done     = set()
+    complete = False
+    with open(path, 'r') as journal:
+        for line in journal:
+            if not line.endswith('\n'):
+                break
+            if line == PLAN_DONE:
+                complete = True
+                continue
+            try:
+                marker, kind, entry = line[:-1].split(' ', 2)
+                entry = entry.decode('string_escape')
+            except ValueError:
+                continue
+            if kind not in KINDS:
+                continue
+            if marker == 'P':
+                planned.append((kind, entry))
+            elif marker == 'D':
+                done.add((kind, entry))
+
+    if not complete:
+        raise ValueError("The plan in journal {} was never completely written, so it can't be resumed.".format(path))
+
+    pending = dict((kind, []) for kind in KINDS)
+    for kind, entry in planned:
+        if (kind, entry) not in done:
+            pending[kind].append(entry)
+
+    return pending['link'], pending['file'], pending['folder']
+
+
+def load_options(path):
+    """
+    :param path: the location of the journal file
+    :return: a dictionary of the options recorded along with the plan
+    """
+    options = {}
+    with open(path, 'r') as journal:
+        for line in journal:
+            if not line.startswith('O ') or not line.endswith('\n'):
+                break
+            try:
+                marker, name, value = line[:-1].split(' ', 2)
+            except ValueError:
+                break
+            options[name] = value.decode('string_escape')
+    return options
+
+
+def _get_complete_length(path, chunk=4096):
+    """
+    :param path: the location of the journal file
+    :return: the length of the journal up to and including its last newline
+    """
+    with open(path, 'rb') as journal:
+        journal.seek(0, os.SEEK_END)
+        end = journal.tell()
+        while end > 0:
+            start = max(end - chunk, 0)
+            journal.seek(start)
+            index = journal.read(end - start).rfind('\n')
+            if index >= 0:
+                return start + index + 1
+            end = start
+    return 0
+
+
+def _format_entry(marker, kind, path):
+    """
+    :return: a single journal line; the path is escaped so that it cannot
+             contain a newline
+    """
+    return "{} {} {}\n".format(marker, kind, path.encode('string_escape'))
@@ -0,0 +1,108 @@
+import sys
+
+
+# The logging levels, as used by Management Tools.
+VERBOSE = 5
+DEBUG   = 10
+INFO    = 20
+WARNING = 30
+ERROR   = 40
+
+
+def get_logger(name, log=True, level=INFO, path=None):
+    """
+    Builds a Management Tools logger if Management Tools is installed, or a
+    FallbackLogger with the same interface if it isn't. Management Tools is
+    only imported here (rather than when the program starts) since importing it
+    takes a good deal longer than the rest of the program does.
+
+    :param name: the name of the logger
+    :param log: whether to write log events out to a file
+    :param level: the lowest level of event to output
+    :param path: where to write the log file
+    :return: a logger with verbose(), debug(), info(), warn(), and error()
+    """
+    try:
+        from management_tools import loggers
+    except ImportError:
+        return FallbackLogger(name, log, level, path)
+    return loggers.get_logger(name=name, log=log, level=level, path=path)
+
+
+class FallbackLogger(object):
+    """
+    A stand-in for a Management Tools logger built on the standard library's
+    logging module. Events are printed to standard output (prefixed with their
+    prompt), and are also written to the file at 'path' if one was given.
+    """
+
+    def __init__(self, name, log=True, level=INFO, path=None):
+        import logging
+        logging.addLevelName(VERBOSE, 'VERBOSE')
+
+        self.logging = logging
+        self.prompts = {
+            VERBOSE: 'VERBOSE: ',
+            DEBUG:   'DEBUG: ',
+            INFO:    'INFO: ',
+            WARNING: 'WARNING: ',
+            ERROR:   'ERROR: ',
+        }
+
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+
+        # Loggers are shared by name, so a logger that's already been set up
+        # keeps its handlers (and their prompts) instead of printing every
+        # event twice.
+        for handler in self.logger.handlers:
+            if isinstance(handler.formatter, _PromptFormatter):
+                self.prompts = handler.formatter.prompts
+        if self.logger.handlers:
+            return
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(_PromptFormatter(self.prompts))
+        self.logger.addHandler(console)
+
+        if log and path:
+            output = logging.FileHandler(path)
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+            self.logger.addHandler(output)
+
+    def set_prompt(self, level, prompt):
+        """
+        Changes what is printed before events of the given level.
+
+        :param level: the logging level
+        :param prompt: the new prompt
+        """
+        self.prompts[level] = prompt
+
+    def verbose(self, message):
+        self.logger.log(VERBOSE, message)
+
+    def debug(self, message):
+        self.logger.log(DEBUG, message)
+
+    def info(self, message):
+        self.logger.log(INFO, message)
+
+    def warn(self, message):
+        self.logger.log(WARNING, message)
+
+    def error(self, message):
+        self.logger.log(ERROR, message)
+
+
+class _PromptFormatter(object):
+    """
+    Formats console events as their level's prompt followed by the message.
+    """
+
+    def __init__(self, prompts):
+        self.prompts = prompts
+
+    def format(self, record):
+        return self.prompts.get(record.levelno, '') + record.getMessage()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+
+# The prefix given to every exported metric.
+PREFIX = 'cleanup_manager_'
+
+# Descriptions of the exported metrics, in the order they are written.
+DESCRIPTIONS = [
+    ('run_timestamp_seconds',   "When the run finished, as a Unix timestamp."),
+    ('run_duration_seconds',    "How long the run took."),
+    ('scan_duration_seconds',   "Time spent taking the inventory of the target."),
+    ('scan_entries',            "Directory entries visited while taking the inventory."),
+    ('scan_entries_per_second', "Directory entries visited per second of scanning."),
+    ('scan_workers',            "The number of scan workers the adaptive scanner settled on."),
+    ('planned_items',           "Items planned for deletion."),
+    ('planned_bytes',           "Bytes planned for deletion."),
+    ('deleted_items',           "Items actually deleted."),
+    ('deleted_bytes',           "Bytes actually deleted (as measured during planning)."),
+    ('errors',                  "Errors encountered while deleting."),
+    ('freeup_target_bytes',     "The amount of space the run was asked to free up."),
+    ('freeup_achieved_bytes',   "The amount of space the run actually freed up."),
+]
+
+# The kinds of items that per-kind metrics are broken down by, and the metrics
+# that are always broken down that way.
+KINDS    = ['link', 'file', 'folder']
+PER_KIND = ['planned_items', 'planned_bytes', 'deleted_items', 'deleted_bytes', 'errors']
+
+# The counters for the current run, keyed by (name, kind). These are updated
+# from the scanning and deletion code (possibly from several threads at once).
+_lock    = threading.Lock()
+_values  = {}
+_sizes   = {}
+_started = time.time()
+
+
+def reset():
+    """
+    Clears all of the counters and starts timing a new run.
+    """
+    global _started
+    with _lock:
+        _values.clear()
+        _sizes.clear()
+        _started = time.time()
+
+
+def inc(name, amount=1, kind=None):
+    """
+    Adds to a counter.
+
+    :param name: the name of the metric (without the prefix)
+    :param amount: how much to add
+    :param kind: the kind of item the counter is for, if any
+    """
+    with _lock:
+        _values[(name, kind)] = _values.get((name, kind), 0) + amount
+
+
+def set_value(name, value, kind=None):
+    """
+    Sets a counter to a specific value.
+
+    :param name: the name of the metric (without the prefix)
+    :param value: the new value
+    :param kind: the kind of item the counter is for, if any
+    """
+    with _lock:
+        _values[(name, kind)] = value
+
+
+def get(name, kind=None):
+    """
+    :param name: the name of the metric (without the prefix)
+    :param kind: the kind of item the counter is for, if any
+    :return: the current value of the counter
+    """
+    with _lock:
+        return _values.get((name, kind), 0)
+
+
+def record_plan(kind, paths, sizes=None):
+    """
+    Counts the items planned for deletion, remembering their sizes so that the
+    space freed can be tallied as they are deleted.
+
+    :param kind: one of 'link', 'file', or 'folder'
+    :param paths: the paths that are going to be deleted
+    :param sizes: a dictionary of the sizes of (at least) those paths
+    """
+    with _lock:
+        total = 0
+        for path in paths:
+            size = (sizes.get(path) if sizes else None) or 0
+            _sizes[(kind, path)] = size
+            total += size
+        _values[('planned_items', kind)] = _values.get(('planned_items', kind), 0) + len(paths)
+        _values[('planned_bytes', kind)] = _values.get(('planned_bytes', kind), 0) + total
+
+
+def record_deleted(kind, path):
+    """
+    Counts an item that was successfully deleted.
+
+    :param kind: one of 'link', 'file', or 'folder'
+    :param path: the path that was deleted
+    """
+    with _lock:
+        _values[('deleted_items', kind)] = _values.get(('deleted_items', kind), 0) + 1
+        _values[('deleted_bytes', kind)] = _values.get(('deleted_bytes', kind), 0) + _sizes.get((kind, path), 0)
+
+
+def write_textfile(path):
+    """
+    Writes the counters for the current run out in the Prometheus text format
+    for node_exporter's textfile collector. The file is replaced atomically so
+    the collector never sees a partial file.
+
+    :param path: where to write the metrics; should end in '.prom'
+    """
+    now = time.time()
+    with _lock:
+        values = dict(_values)
+        values[('run_timestamp_seconds', None)] = now
+        values[('run_duration_seconds', None)]  = now - _started
+    for name in PER_KIND:
+        for kind in KINDS:
+            values.setdefault((name, kind), 0)
+
+    duration = values.get(('scan_duration_seconds', None), 0)
+    if duration > 0:
+        values[('scan_entries_per_second', None)] = values.get(('scan_entries', None), 0) / duration
+    values[('freeup_achieved_bytes', None)] = sum(values.get(('deleted_bytes', kind), 0) for kind in KINDS)
+
+    lines = []
+    for name, description in DESCRIPTIONS:
+        samples = sorted((kind, value) for (key, kind), value in values.items() if key == name)
+        if not samples:
+            continue
+        lines.append("# HELP {}{} {}".format(PREFIX, name, description))
+        lines.append("# TYPE {}{} gauge".format(PREFIX, name))
+        for kind, value in samples:
+            labels = '{{kind="{}"}}'.format(kind) if kind is not None else ''
+            lines.append("{}{}{} {}".format(PREFIX, name, labels, repr(float(value))))
+
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(handle, 'w') as output:
+            output.write('\n'.join(lines) + '\n')
+            output.flush()
+            os.fsync(output.fileno())
+        os.chmod(temporary, 0o644)
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
@@ -0,0 +1,211 @@
+import bisect
+import datetime
+import time
+
+
+# The default keep-after thresholds (in days) to evaluate in a report.
+DEFAULT_THRESHOLDS = [1, 2, 7, 14, 30, 60, 90, 180, 365, 730]
+
+# The upper edges (in bytes) of the size buckets used in a report.
+SIZE_BUCKETS = [1024 ** 1, 1024 ** 2, 1024 ** 3, 1024 ** 4]
+
+
+def get_age_distribution(folders, files, now=None, thresholds=None):
+    """
+    Sorts the top-level items of an inventory by age and builds a running total
+    of their sizes, so that the amount of data removed by any keep-after date
+    can be looked up without walking the inventory again.
+
+    Items whose size was never measured (eg folders with a trigger file) are
+    counted as taking up no space.
+
+    :param folders: an inventory of the folders (see analysis.get_inventory())
+    :param files: an inventory of the files (see analysis.get_inventory())
+    :param now: the Unix timestamp that ages are measured from
+    :param thresholds: a list of ages (in days) to evaluate
+    :return: a list of tuples as (days, keep-after timestamp, item count, bytes)
+             giving what a keep-after of 'days' ago would delete
+    """
+    if now is None:
+        now = time.time()
+    if thresholds is None:
+        thresholds = DEFAULT_THRESHOLDS
+
+    ages, prefix = _get_prefix_sums(folders, files)
+
+    distribution = []
+    for days in sorted(thresholds):
+        keep_after = now - days * 86400
+        # Everything with a timestamp before 'keep_after' would be deleted.
+        count = bisect.bisect_left(ages, keep_after)
+        distribution.append((days, keep_after, count, prefix[count]))
+
+    return distribution
+
+
+def get_minimum_keep_after(target_space, folders, files):
+    """
+    Finds the earliest keep-after date (in whole seconds) that would delete at
+    least 'target_space' bytes from the inventory.
+
+    :param target_space: the amount of space to free up
+    :param folders: an inventory of the folders (see analysis.get_inventory())
+    :param files: an inventory of the files (see analysis.get_inventory())
+    :return: a tuple as (keep-after timestamp, item count, bytes), or None if
+             deleting everything would not free up enough space
+    """
+    ages, prefix = _get_prefix_sums(folders, files)
+
+    # The running total only grows, so the first position where it meets the
+    # target gives the fewest (oldest) items that need to go.
+    count = bisect.bisect_left(prefix, target_space)
+    if count >= len(prefix):
+        return None
+    if count == 0:
+        return ages[0] if ages else 0, 0, 0
+
+    # The keep-after must be strictly later than the newest item removed.
+    keep_after = int(ages[count - 1]) + 1
+    count      = bisect.bisect_left(ages, keep_after)
+    return keep_after, count, prefix[count]
+
+
+def get_age_histogram(folders, files, now=None, thresholds=None):
+    """
+    Counts the top-level items of an inventory in age buckets.
+
+    :param folders: an inventory of the folders (see analysis.get_inventory())
+    :param files: an inventory of the files (see analysis.get_inventory())
+    :param now: the Unix timestamp that ages are measured from
+    :param thresholds: a list of bucket edges (in days)
+    :return: a list of tuples as (lower days, upper days, item count, bytes),
+             where the last bucket's upper edge is None
+    """
+    if now is None:
+        now = time.time()
+    if thresholds is None:
+        thresholds = DEFAULT_THRESHOLDS
+
+    edges     = [0] + sorted(thresholds)
+    histogram = [[0, 0] for _ in edges]
+    for item in folders + files:
+        days  = (now - item[1]) / 86400.0
+        index = max(bisect.bisect_right(edges, days) - 1, 0)
+        histogram[index][0] += 1
+        histogram[index][1] += item[2] or 0
+
+    uppers = edges[1:] + [None]
+    return [(edges[i], uppers[i], histogram[i][0], histogram[i][1]) for i in range(len(edges))]
+
+
+def get_size_histogram(folders, files, buckets=None):
+    """
+    Counts the top-level items of an inventory in size buckets.
+
+    :param folders: an inventory of the folders (see analysis.get_inventory())
+    :param files: an inventory of the files (see analysis.get_inventory())
+    :param buckets: a list of bucket edges (in bytes)
+    :return: a list of tuples as (lower bytes, upper bytes, item count, bytes),
+             where the last bucket's upper edge is None
+    """
+    if buckets is None:
+        buckets = SIZE_BUCKETS
+
+    edges     = [0] + sorted(buckets)
+    histogram = [[0, 0] for _ in edges]
+    for item in folders + files:
+        size  = item[2] or 0
+        index = bisect.bisect_right(edges, size) - 1
+        histogram[index][0] += 1
+        histogram[index][1] += size
+
+    uppers = edges[1:] + [None]
+    return [(edges[i], uppers[i], histogram[i][0], histogram[i][1]) for i in range(len(edges))]
+
+
+def log_report(folders, files, logger, target_space=None, now=None, thresholds=None):
+    """
+    Outputs the age and size distribution of an inventory, along with how much
+    data each keep-after threshold would free up. Nothing is deleted.
+
+    :param folders: an inventory of the folders (see analysis.get_inventory())
+    :param files: an inventory of the files (see analysis.get_inventory())
+    :param logger: a Management Tools logger object
+    :param target_space: if given, also report the earliest keep-after date
+                         that would free up this many bytes
+    :param now: the Unix timestamp that ages are measured from
+    :param thresholds: a list of ages (in days) to evaluate
+    """
+    if now is None:
+        now = time.time()
+
+    total = sum(item[2] or 0 for item in folders + files)
+    logger.info("Inventory: {} folders, {} files, {}".format(len(folders), len(files), format_bytes(total)))
+
+    logger.info("Age distribution:")
+    for lower, upper, count, size in get_age_histogram(folders, files, now, thresholds):
+        if upper is None:
+            label = "{} days or more".format(lower)
+        else:
+            label = "{} to {} days".format(lower, upper)
+        logger.info("    {:<20} {:>10} items {:>12}".format(label, count, format_bytes(size)))
+
+    logger.info("Size distribution:")
+    for lower, upper, count, size in get_size_histogram(folders, files):
+        if upper is None:
+            label = "{} or more".format(format_bytes(lower))
+        else:
+            label = "{} to {}".format(format_bytes(lower), format_bytes(upper))
+        logger.info("    {:<20} {:>10} items {:>12}".format(label, count, format_bytes(size)))
+
+    logger.info("Space freed by keep-after:")
+    for days, keep_after, count, size in get_age_distribution(folders, files, now, thresholds):
+        logger.info("    {:>5} days ({}) {:>10} items {:>12}".format(days, _format_time(keep_after), count, format_bytes(size)))
+
+    if target_space is not None:
+        minimum = get_minimum_keep_after(target_space, folders, files)
+        if minimum is None:
+            logger.info("Deleting everything would not free up {}.".format(format_bytes(target_space)))
+        else:
+            keep_after, count, size = minimum
+            logger.info("Freeing up {} requires a keep-after of at least {} ({:.1f} days ago): {} items, {}".format(
+                format_bytes(target_space), _format_time(keep_after), (now - keep_after) / 86400.0, count, format_bytes(size)
+            ))
+
+
+def format_bytes(size):
+    """
+    :param size: a number of bytes
+    :return: a short human-readable representation of 'size'
+    """
+    for unit in ['B', 'K', 'M', 'G', 'T']:
+        if abs(size) < 1024 or unit == 'T':
+            break
+        size /= 1024.0
+    if unit == 'B':
+        return "{}B".format(int(size))
+    return "{:.1f}{}".format(size, unit)
+
+
+def _format_time(timestamp):
+    """
+    :param timestamp: a Unix timestamp
+    :return: the local date and time, formatted to be usable with --keep-after
+             and a --date-format of '%Y-%m-%d %H:%M:%S'
+    """
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _get_prefix_sums(folders, files):
+    """
+    :param folders: an inventory of the folders (see analysis.get_inventory())
+    :param files: an inventory of the files (see analysis.get_inventory())
+    :return: the sorted ages of all items, and the running total of their sizes
+             where prefix[i] is the combined size of the i oldest items
+    """
+    items  = sorted((item[1], item[2] or 0) for item in folders + files)
+    ages   = [item[0] for item in items]
+    prefix = [0]
+    for item in items:
+        prefix.append(prefix[-1] + item[1])
+    return ages, prefix
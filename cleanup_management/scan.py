@@ -0,0 +1,339 @@
+import collections
+import os
+import stat
+import sys
+import threading
+import time
+
+import metrics
+
+
+# How often (in seconds) the scanner reconsiders its concurrency, and the
+# fewest stat calls it needs to have seen before it does.
+ADJUST_INTERVAL = 0.5
+ADJUST_MINIMUM  = 200
+
+# How much throughput has to improve by for a higher level to be kept.
+GAIN = 0.1
+
+# How much the time per stat call has to grow by (compared to when the level
+# was settled on) before the scanner backs off.
+BACKOFF = 2.0
+
+
+class AdaptiveScanner(object):
+    """
+    Measures the age and size of many top-level folders at once with a pool of
+    threads, choosing how many threads to use as it goes.
+
+    Each directory in the target's folders is a separate unit of work, so even
+    a single huge folder gets spread across all of the threads. The number of
+    threads allowed to run starts at 'start' and doubles each time throughput
+    (stat calls per second) improves noticeably. Once a higher level stops
+    helping, the scanner settles on the best level seen so far. If the time
+    taken per stat call later rises well above what it was when the level was
+    settled on (eg because the volume has become busy), the level is halved.
+
+    Folders are measured the same way as in analysis.iter_inventory() and come
+    out in the order they were given, each preceded by the links found inside
+    of it, so that plans made from either are the same.
+    """
+
+    def __init__(self, folders, logger, describe_link, find_trigger_age=None, device=None, workers=8, start=1, fs=None):
+        """
+        :param folders: the paths of the top-level folders to measure
+        :param logger: a Management Tools logger object
+        :param describe_link: a function giving the inventory tuple of a link
+                              (see symlinks.LinkResolver.describe())
+        :param find_trigger_age: a function taking a directory and the names
+                                 of the entries in it and returning the age of
+                                 its newest trigger file (or None); folders
+                                 with a trigger are not walked
+        :param device: the device to stay on, or None
+        :param workers: the most threads to ever run at once
+        :param start: the number of threads to start out with
+        :param fs: the filesystem to look at (see filesystem.py)
+        """
+        self.folders          = [_Folder(path) for path in folders]
+        self.logger           = logger
+        self.describe_link    = describe_link
+        self.find_trigger_age = find_trigger_age
+        self.device           = device
+        self.workers          = max(workers, 1)
+        self.level            = min(max(start, 1), self.workers)
+        self.fs               = fs
+        self.condition        = threading.Condition()
+        self.tasks            = collections.deque((folder.path, folder) for folder in reversed(self.folders))
+        self.finished         = False
+        self.error            = None
+
+        # The throughput seen since the level was last reconsidered.
+        self.window_started = time.time()
+        self.window_stats   = 0
+        self.window_time    = 0.0
+
+        # The best throughput seen so far, the level it was seen at, and the
+        # time per stat call at that level.
+        self.settled      = False
+        self.best_rate    = None
+        self.best_level   = self.level
+        self.best_latency = None
+
+    def __iter__(self):
+        """
+        :return: a generator of (kind, item) tuples as described in
+                 analysis.iter_inventory()
+        """
+        threads = [threading.Thread(target=self._work, args=(index,)) for index in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for folder in self.folders:
+                with self.condition:
+                    while not folder.done and self.error is None:
+                        self.condition.wait(ADJUST_INTERVAL)
+                        self._adjust()
+                    if self.error is not None:
+                        raise self.error[0], self.error[1], self.error[2]
+                for link in folder.links:
+                    yield 'link', link
+                metrics.inc('scan_entries', folder.entries)
+                yield 'folder', (folder.path, folder.age, folder.size)
+                # Nothing more is needed from the folder, so let it go.
+                folder.links = None
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+            for thread in threads:
+                thread.join()
+
+        self.logger.info("Scan concurrency settled at {} workers.".format(self.level))
+        metrics.set_value('scan_workers', self.level)
+
+    def _work(self, index):
+        """
+        Runs directory scans for as long as there are any to do, but only while
+        this thread's index is below the current level.
+
+        :param index: the number of this thread
+        """
+        while True:
+            with self.condition:
+                while not self.finished and self.error is None and not (index < self.level and self.tasks):
+                    self.condition.wait(ADJUST_INTERVAL)
+                if self.finished or self.error is not None:
+                    return
+                # Work is taken from the end so that the folders are finished
+                # (more or less) in order and the queue stays short.
+                path, folder = self.tasks.pop()
+
+            try:
+                started = time.time()
+                result  = self._scan(path, folder)
+                elapsed = time.time() - started
+            except:
+                with self.condition:
+                    self.error = sys.exc_info()
+                    self.condition.notify_all()
+                return
+
+            age, size, links, subdirs, entries, stats = result
+            with self.condition:
+                if age > folder.age:
+                    folder.age = age
+                if size is None:
+                    folder.size = None
+                else:
+                    folder.size += size
+                folder.links.extend(links)
+                folder.entries += entries
+                folder.pending += len(subdirs) - 1
+                self.tasks.extend((subdir, folder) for subdir in subdirs)
+                self.window_stats += stats
+                self.window_time  += elapsed
+                self.condition.notify_all()
+
+    def _scan(self, path, folder):
+        """
+        Looks at the contents of a single directory.
+
+        :param path: the directory
+        :param folder: the top-level folder it is part of
+        :return: the newest timestamp and total size of the files found, the
+                 links found, the subdirectories left to look at, the number of
+                 entries, and the number of stat calls made
+        """
+        fs    = self.fs
+        age   = 0
+        size  = 0
+        links = []
+        stats = 1
+        top   = path == folder.path
+        if top:
+            age    = fs.getmtime(path)
+            stats += 1
+
+        try:
+            names = fs.listdir(path)
+        except OSError:
+            # Unreadable directories are skipped, just like os.walk() does.
+            return age, size, links, [], 0, stats
+
+        subdirs = []
+        found   = []
+        for name in names:
+            child = os.path.join(path, name)
+            try:
+                info = fs.lstat(child)
+            except OSError:
+                continue
+            stats += 1
+            if stat.S_ISLNK(info.st_mode):
+                # Links to directories count towards the age of the folder
+                # (by their target's timestamp), but links to files don't.
+                stats += 1
+                if fs.isdir(child):
+                    age = max(age, fs.getmtime(child))
+                found.append(child)
+            elif stat.S_ISDIR(info.st_mode):
+                if self.device is not None and info.st_dev != self.device:
+                    self.logger.info("    Not crossing filesystem boundary: {}".format(child))
+                    continue
+                age = max(age, info.st_mtime)
+                subdirs.append(child)
+            else:
+                age   = max(age, info.st_mtime)
+                size += info.st_size
+
+        if top and self.find_trigger_age is not None:
+            trigger_age = self.find_trigger_age(path, names)
+            if trigger_age is not None:
+                self.logger.verbose("    Found trigger in folder: {}".format(path))
+                return trigger_age, None, [], [], len(names), stats
+
+        links = [self.describe_link(link) for link in found]
+        return age, size, links, subdirs, len(names), stats
+
+    def _adjust(self):
+        """
+        Reconsiders the number of threads allowed to run, based on the
+        throughput since the last time. Must be called with the condition held.
+        """
+        elapsed = time.time() - self.window_started
+        if elapsed < ADJUST_INTERVAL or self.window_stats < ADJUST_MINIMUM:
+            return
+
+        rate    = self.window_stats / elapsed
+        latency = self.window_time / self.window_stats
+        self.window_started = time.time()
+        self.window_stats   = 0
+        self.window_time    = 0.0
+
+        level = self.level
+        if not self.settled:
+            if self.best_rate is None or rate > self.best_rate * (1 + GAIN):
+                # Keep climbing for as long as it pays off.
+                self.best_rate    = rate
+                self.best_level   = level
+                self.best_latency = latency
+                if level < self.workers:
+                    level = min(level * 2, self.workers)
+                else:
+                    self.settled = True
+            else:
+                # The last increase didn't help (or made things worse), so go
+                # back to the best level seen.
+                level             = self.best_level
+                self.settled      = True
+        elif self.best_latency is None:
+            self.best_latency = latency
+        elif latency > self.best_latency * BACKOFF and level > 1:
+            # Stat calls are getting slower; ease off and take a new baseline.
+            level             = max(level // 2, 1)
+            self.best_latency = None
+
+        if level != self.level:
+            self.logger.verbose("    Scanning with {} workers ({:.0f} stat calls per second).".format(level, rate))
+            self.level = level
+            self.condition.notify_all()
+
+
+class _Folder(object):
+    """
+    The progress made on measuring one top-level folder.
+    """
+
+    def __init__(self, path):
+        self.path    = path
+        self.age     = 0
+        self.size    = 0
+        self.links   = []
+        self.entries = 0
+        self.pending = 1
+
+    @property
+    def done(self):
+        return self.pending == 0
+
+
+def load_level(path, target):
+    """
+    :param path: the location of a scan state file
+    :param target: the directory being scanned
+    :return: the level that the last scan of anything on the same volume as
+             'target' settled on, or None
+    """
+    import json
+    try:
+        with open(path, 'r') as state:
+            return json.load(state).get(get_mount_point(target))
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def save_level(path, target, level):
+    """
+    Remembers the level that scanning 'target' settled on, so that the next
+    scan of any target on the same volume can start there. Levels are kept by
+    the volume's mount point, since how much concurrency pays off depends on
+    the storage rather than on the directory. The levels for other volumes in
+    the same file are kept.
+
+    :param path: the location of a scan state file
+    :param target: the directory that was scanned
+    :param level: the number of workers the scan settled on
+    """
+    import json
+    import tempfile
+    try:
+        with open(path, 'r') as state:
+            levels = json.load(state)
+        if not isinstance(levels, dict):
+            levels = {}
+    except (IOError, ValueError):
+        levels = {}
+    levels[get_mount_point(target)] = level
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(handle, 'w') as output:
+            json.dump(levels, output, indent=4, sort_keys=True)
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
+
+
+def get_mount_point(path):
+    """
+    :param path: any existing path
+    :return: the mount point of the volume that 'path' lives on
+    """
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
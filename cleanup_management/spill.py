@@ -0,0 +1,122 @@
+import cPickle as pickle
+import heapq
+import os
+import shutil
+
+
+class SpillSorter(object):
+    """
+    Sorts an arbitrary number of records while only ever holding a fixed number
+    of them in memory.
+
+    Records are buffered until 'max_records' have been added, at which point
+    the buffer is sorted and written out to a run file on disk. Iterating over
+    the sorter merges all of the runs back together lazily, so the records come
+    out in sorted order one at a time. If everything fit in the buffer, nothing
+    is ever written to disk.
+
+    Records must be tuples that can be pickled and compared with one another.
+    """
+
+    def __init__(self, max_records, directory=None, max_runs=64):
+        """
+        :param max_records: the number of records to hold in memory at once
+        :param directory: where to keep the run files (defaults to the system's
+                          temporary directory)
+        :param max_runs: the number of run files to merge at one time; if there
+                         are more runs than this, they are merged in passes
+        """
+        if max_records < 1:
+            raise ValueError("Must be able to hold at least one record in memory.")
+        if max_runs < 2:
+            raise ValueError("Must be able to merge at least two runs at once.")
+
+        self.max_records = max_records
+        self.max_runs    = max_runs
+        self.directory   = directory
+        self.buffer      = []
+        self.runs        = []
+        self.workspace   = None
+
+    def add(self, record):
+        """
+        Adds a record to be sorted, spilling the buffer to disk if it is full.
+
+        :param record: a tuple to sort
+        """
+        self.buffer.append(record)
+        if len(self.buffer) >= self.max_records:
+            self._spill()
+
+    def __iter__(self):
+        """
+        :return: a generator of all of the records that were added, in order
+        """
+        if not self.runs:
+            self.buffer.sort()
+            return iter(self.buffer)
+
+        # Flush whatever is left in memory so that everything gets merged the
+        # same way.
+        if self.buffer:
+            self._spill()
+
+        # Merge the runs in passes until few enough are left to merge at once.
+        while len(self.runs) > self.max_runs:
+            group     = self.runs[:self.max_runs]
+            self.runs = self.runs[self.max_runs:]
+            self.runs.append(self._write_run(heapq.merge(*[_read_run(run) for run in group])))
+            for run in group:
+                os.remove(run)
+
+        return heapq.merge(*[_read_run(run) for run in self.runs])
+
+    def close(self):
+        """
+        Removes all of the run files from disk.
+        """
+        self.buffer = []
+        self.runs   = []
+        if self.workspace is not None:
+            shutil.rmtree(self.workspace, ignore_errors=True)
+            self.workspace = None
+
+    def _spill(self):
+        """
+        Sorts the buffer and writes it out as a new run.
+        """
+        self.buffer.sort()
+        self.runs.append(self._write_run(self.buffer))
+        self.buffer = []
+
+    def _write_run(self, records):
+        """
+        :param records: an iterable of records, already in sorted order
+        :return: the path to the run file they were written to
+        """
+        import tempfile
+        if self.workspace is None:
+            self.workspace = tempfile.mkdtemp(prefix='cleanup_manager.', dir=self.directory)
+
+        handle, path = tempfile.mkstemp(suffix='.run', dir=self.workspace)
+        with os.fdopen(handle, 'wb') as run:
+            pickler = pickle.Pickler(run, pickle.HIGHEST_PROTOCOL)
+            for record in records:
+                pickler.dump(record)
+                # Don't let the pickler remember every record it has written.
+                pickler.clear_memo()
+        return path
+
+
+def _read_run(path):
+    """
+    :param path: the path to a run file
+    :return: a generator of the records in the run
+    """
+    with open(path, 'rb') as run:
+        unpickler = pickle.Unpickler(run)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
@@ -0,0 +1,120 @@
+import os
+
+import filesystem
+
+
+class LinkResolver(object):
+    """
+    Resolves links to their real paths the way os.path.realpath() does, but
+    remembers what every directory entry along the way resolved to. Links that
+    live in (or point into) the same directories then share all of that work;
+    each entry is only ever checked for being a link (and read) once, instead
+    of once per link that passes through it.
+
+    Nothing is ever forgotten, so a resolver should only be used for a single
+    pass over a tree that isn't changing underneath it.
+    """
+
+    def __init__(self, target, fs=None):
+        """
+        :param target: the directory the inventory is being taken of; links
+                       are 'internal' if they resolve to somewhere inside it
+        :param fs: the filesystem the links are on (see filesystem.py)
+        """
+        if fs is None:
+            fs = filesystem.OS
+
+        self.fs     = fs
+        self.cache  = {}
+        self.target = self.resolve(target)
+        self.parts  = _split(self.target)
+
+    def describe(self, link):
+        """
+        :param link: the path to a link object
+        :return: a tuple as (link path, target path, internal) as described in
+                 analysis.get_inventory()
+        """
+        realpath = self.resolve(link)
+        return link, realpath, self.is_inside(realpath)
+
+    def resolve(self, path):
+        """
+        :param path: any path
+        :return: the path with every link in it resolved
+        """
+        if not os.path.isabs(path):
+            path = os.path.join(os.getcwd(), path)
+        # Whatever is left unresolved after a loop is still normalized, just as
+        # realpath() does.
+        return os.path.normpath(self._follow('/', path, frozenset())[0])
+
+    def is_inside(self, path):
+        """
+        Compares whole path components, so that eg '/a/bc' is not considered to
+        be inside of '/a/b'.
+
+        :param path: a resolved path
+        :return: whether 'path' is the target or somewhere inside of it
+        """
+        return _split(path)[:len(self.parts)] == self.parts
+
+    def _follow(self, where, path, seen):
+        """
+        :param where: the resolved directory to start from
+        :param path: the path to follow from 'where'
+        :param seen: the entries being resolved further up, to catch loops
+        :return: the resolved path, and whether it could be fully resolved
+        """
+        names = path.split('/')
+        for index, name in enumerate(names):
+            if name in ('', '.'):
+                continue
+            if name == '..':
+                where = os.path.dirname(where)
+                continue
+            where, complete = self._step(where, name, seen)
+            if not complete:
+                # Caught in a loop of links; leave the rest of the path as it
+                # is, like realpath() does.
+                return os.path.join(where, *names[index + 1:]), False
+        return where, True
+
+    def _step(self, parent, name, seen):
+        """
+        :param parent: a resolved directory
+        :param name: the name of an entry in that directory
+        :param seen: the entries being resolved further up, to catch loops
+        :return: the resolved path of the entry, and whether it could be fully
+                 resolved
+        """
+        key = (parent, name)
+        if key in self.cache:
+            return self.cache[key], True
+
+        path = os.path.join(parent, name)
+        if key in seen:
+            return path, False
+
+        try:
+            target = self.fs.readlink(path) if self.fs.islink(path) else None
+        except OSError:
+            target = None
+        if target is None:
+            resolved, complete = path, True
+        else:
+            start              = '/' if target.startswith('/') else parent
+            resolved, complete = self._follow(start, target, seen | set([key]))
+
+        # What a loop resolves to depends on where it was entered from, so
+        # only remember entries that resolved completely.
+        if complete:
+            self.cache[key] = resolved
+        return resolved, complete
+
+
+def _split(path):
+    """
+    :return: the components of an absolute path
+    """
+    return [name for name in path.split('/') if name]
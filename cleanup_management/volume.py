@@ -0,0 +1,37 @@
+import os
+
+
+class Volume(object):
+    """
+    The size of the volume that a path lives on, found with statvfs(). This
+    provides the same 'bytes' and 'bytes_free' attributes as a Management Tools
+    fs_analysis.Filesystem, without having to import Management Tools.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: any path on the volume
+        """
+        info = os.statvfs(path)
+
+        self.path       = path
+        self.bytes      = info.f_blocks * info.f_frsize
+        self.bytes_free = info.f_bavail * info.f_frsize
+
+
+def get_volume(target):
+    """
+    :param target: a path on the volume to look at
+    :return: an object with the total and free 'bytes' of the volume 'target'
+             lives on; Management Tools is only used when statvfs() is not
+             available
+    """
+    target = os.path.abspath(os.path.expanduser(target))
+    if hasattr(os, 'statvfs'):
+        return Volume(target)
+
+    from management_tools import fs_analysis as fsa
+    # Check for MT version 1.8.1
+    if not "bytes" in dir(fsa.Filesystem):
+        raise ImportError("You need version 1.8.1 or greater of the 'Management Tools' module to be installed.")
+    return fsa.Filesystem(fsa.get_responsible_fs(target))
@@ -0,0 +1,456 @@
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import time
+
+import symlinks
+
+
+# inotify event flags (see inotify(7)).
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR       = 0x40000000
+
+# inotify_init1() flags.
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC  = 0o2000000
+
+# Everything that can change a folder's age or size.
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+# The fixed-size header of a struct inotify_event: wd, mask, cookie, len.
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """
+    A minimal wrapper around the Linux inotify interface.
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise RuntimeError("Watching for changes is only supported on Linux.")
+
+        # ctypes is slow to import, and only needed when actually watching.
+        import ctypes
+        import ctypes.util
+
+        self.get_errno = ctypes.get_errno
+        self.libc      = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd        = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = self.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        :param path: the directory to watch
+        :param mask: the events to watch for
+        :return: the watch descriptor
+        """
+        wd = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            error = self.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def rm_watch(self, wd):
+        """
+        Stops watching a directory. Errors are ignored, since the kernel drops
+        watches on its own when their directory is deleted.
+
+        :param wd: the watch descriptor
+        """
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """
+        Waits up to 'timeout' seconds for events and reads all that are ready.
+
+        :param timeout: the number of seconds to wait
+        :return: a list of tuples as (wd, mask, name)
+        """
+        events = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return events
+
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+                offset += EVENT_HEADER.size
+                name    = buffer[offset:offset + length].rstrip('\0')
+                offset += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LiveIndex(object):
+    """
+    Keeps the age and size of every top-level item in a target directory up to
+    date by watching the whole tree with inotify, so that the inventory can be
+    produced at any time without walking the target again.
+
+    Each event only records which path changed. Once a batch of events has been
+    read, every changed path is checked against the filesystem (with a single
+    lstat()) and the index is updated to match, which makes the result
+    independent of the order the events arrived in.
+
+    If the number of watches would exceed 'max_watches' (or the kernel's own
+    limit), the folder that could not be fully watched is instead rescanned
+    each time an inventory is taken. If the kernel's event queue overflows, the
+    whole target is rescanned.
+    """
+
+    def __init__(self, target, logger, max_watches=8192, one_file_system=False):
+        """
+        :param target: the directory to keep an index of
+        :param logger: a Management Tools logger object
+        :param max_watches: the most directories to watch at once
+        :param one_file_system: whether to stay on the filesystem of 'target'
+        """
+        if not os.path.isdir(target):
+            raise ValueError("The target must be a valid, existing directory.")
+
+        self.target      = target
+        self.logger      = logger
+        self.max_watches = max_watches
+        self.device      = os.stat(target).st_dev if one_file_system else None
+        self.inotify     = None
+
+    def scan(self):
+        """
+        (Re)builds the whole index from scratch.
+        """
+        if self.inotify is not None:
+            self.inotify.close()
+        self.inotify   = Inotify()
+        self.watches   = {}
+        self.watched   = {}
+        self.folders   = {}
+        self.files     = {}
+        self.links     = set()
+        self.unwatched = set()
+
+        self.logger.verbose("Building live index of {}".format(self.target))
+        self._add_watch(self.target, None)
+        for name in os.listdir(self.target):
+            self._update_top_level(os.path.join(self.target, name))
+        self.logger.verbose("Watching {} directories.".format(len(self.watches)))
+
+    def wait(self, timeout):
+        """
+        Waits up to 'timeout' seconds for changes and applies any that happen.
+
+        :param timeout: the number of seconds to wait
+        """
+        changed = set()
+        for wd, mask, name in self.inotify.read_events(timeout):
+            if mask & IN_Q_OVERFLOW:
+                self.logger.warn("Too many changes to keep up with; rescanning {}".format(self.target))
+                self.scan()
+                return
+            if mask & IN_IGNORED:
+                self._forget_watch(wd)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            # The directory itself changed (its mtime did, at least), as did the
+            # entry within it.
+            changed.add(directory)
+            if name:
+                changed.add(os.path.join(directory, name))
+
+        # Deal with things that went away before things that showed up, so that
+        # a directory moved within the tree has its old watches cleared out
+        # before it is watched under its new name.
+        present = []
+        for path in changed:
+            try:
+                present.append((path, os.lstat(path)))
+            except OSError:
+                self._remove(path)
+        for path, info in sorted(present):
+            self._update(path, info)
+
+    def get_inventory(self, resolver=None):
+        """
+        Produces the inventory in the same form as analysis.get_inventory().
+        Folders that could not be fully watched are rescanned first.
+
+        :param resolver: the symlinks.LinkResolver to resolve the links with;
+                         a new one is used if none is given
+        :return: a tuple containing lists containing tuples describing the
+                 contents as (folders, files, links)
+        """
+        for folder in list(self.unwatched):
+            # The folder stays unwatched while it's rescanned, so that no new
+            # watches are tried (and given up on) every time.
+            self.logger.verbose("Rescanning unwatched folder: {}".format(folder))
+            self.folders.pop(folder, None)
+            self.files.pop(folder, None)
+            self.links.discard(folder)
+            self._update_top_level(folder)
+            if folder not in self.folders:
+                self.unwatched.discard(folder)
+
+        folders = [(path, entry['age'], entry['size']) for path, entry in self.folders.items()]
+        files   = [(path, entry[0], entry[1]) for path, entry in self.files.items()]
+
+        links = list(self.links)
+        for entry in self.folders.values():
+            links.extend(entry['links'])
+        if resolver is None:
+            resolver = symlinks.LinkResolver(self.target)
+        links = [resolver.describe(link) for link in links if os.path.lexists(link)]
+
+        return folders, files, links
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    ##--------------------------------------------------------------------------
+    ## Index maintenance.
+    ##--------------------------------------------------------------------------
+
+    def _get_top_level(self, path):
+        """
+        :return: the top-level item that 'path' is inside of (or is), or None if
+                 'path' is the target itself
+        """
+        if path == self.target:
+            return None
+        relative = path[len(self.target) + 1:]
+        return os.path.join(self.target, relative.split(os.sep, 1)[0])
+
+    def _update_top_level(self, path):
+        """
+        Adds or refreshes a top-level item.
+        """
+        try:
+            info = os.lstat(path)
+        except OSError:
+            return
+        if stat.S_ISLNK(info.st_mode):
+            self.links.add(path)
+        elif stat.S_ISDIR(info.st_mode):
+            if self.device is not None and info.st_dev != self.device:
+                self.logger.info("    Not crossing filesystem boundary: {}".format(path))
+                return
+            self.folders[path] = {'age': info.st_mtime, 'size': 0, 'sizes': {}, 'links': set()}
+            self._scan(path, path)
+        else:
+            self.files[path] = (info.st_mtime, info.st_size)
+
+    def _scan(self, top, directory):
+        """
+        Walks a directory within a top-level folder, adding everything in it to
+        that folder's entry and watching every directory along the way.
+        """
+        entry = self.folders[top]
+        for path, subdirs, subfiles in os.walk(directory):
+            self._add_watch(path, top)
+
+            for name in list(subdirs):
+                subdir = os.path.join(path, name)
+                try:
+                    info = os.lstat(subdir)
+                except OSError:
+                    subdirs.remove(name)
+                    continue
+                if stat.S_ISLNK(info.st_mode):
+                    entry['links'].add(subdir)
+                elif self.device is not None and info.st_dev != self.device:
+                    self.logger.info("    Not crossing filesystem boundary: {}".format(subdir))
+                    subdirs.remove(name)
+                    continue
+                entry['age'] = max(entry['age'], info.st_mtime)
+
+            for name in subfiles:
+                file = os.path.join(path, name)
+                try:
+                    info = os.lstat(file)
+                except OSError:
+                    continue
+                if stat.S_ISLNK(info.st_mode):
+                    entry['links'].add(file)
+                else:
+                    self._set_size(entry, file, info.st_size)
+                    entry['age'] = max(entry['age'], info.st_mtime)
+
+    def _update(self, path, info):
+        """
+        Brings the index up to date with an item that exists.
+        """
+        top = self._get_top_level(path)
+        if top is None:
+            return
+        if path == top:
+            if top in self.folders and stat.S_ISDIR(info.st_mode):
+                entry = self.folders[top]
+                entry['age'] = max(entry['age'], info.st_mtime)
+            else:
+                self._remove(top)
+                self._update_top_level(top)
+            return
+
+        entry = self.folders.get(top)
+        if entry is None:
+            return
+        if stat.S_ISLNK(info.st_mode):
+            self._set_size(entry, path, None)
+            entry['links'].add(path)
+        elif stat.S_ISDIR(info.st_mode):
+            if path not in self.watched and top not in self.unwatched:
+                if self.device is not None and info.st_dev != self.device:
+                    return
+                self._scan(top, path)
+        else:
+            entry['links'].discard(path)
+            self._set_size(entry, path, info.st_size)
+        entry['age'] = max(entry['age'], info.st_mtime)
+
+    def _remove(self, path):
+        """
+        Removes an item that no longer exists (along with anything inside of it)
+        from the index.
+        """
+        top = self._get_top_level(path)
+        if top is None:
+            return
+        if path == top:
+            self.files.pop(path, None)
+            self.links.discard(path)
+            self.unwatched.discard(path)
+            if self.folders.pop(path, None) is not None:
+                self._drop_watches(path)
+            return
+
+        entry = self.folders.get(top)
+        if entry is None:
+            return
+        entry['links'].discard(path)
+        self._set_size(entry, path, None)
+        if path in self.watched:
+            # A whole directory went away.
+            prefix = path + os.sep
+            for file in [file for file in entry['sizes'] if file.startswith(prefix)]:
+                self._set_size(entry, file, None)
+            for link in [link for link in entry['links'] if link.startswith(prefix)]:
+                entry['links'].discard(link)
+            self._drop_watches(path)
+
+    def _set_size(self, entry, path, size):
+        """
+        Records the size of a file within a folder (or forgets the file if the
+        size is None), keeping the folder's total size current.
+        """
+        entry['size'] -= entry['sizes'].pop(path, 0)
+        if size is not None:
+            entry['sizes'][path] = size
+            entry['size'] += size
+
+    ##--------------------------------------------------------------------------
+    ## Watch bookkeeping.
+    ##--------------------------------------------------------------------------
+
+    def _add_watch(self, path, top):
+        """
+        Starts watching a directory. If that isn't possible, the top-level
+        folder it belongs to falls back to being rescanned.
+        """
+        if top in self.unwatched:
+            return
+        if len(self.watches) >= self.max_watches:
+            error = "watch limit of {} reached".format(self.max_watches)
+        else:
+            try:
+                wd = self.inotify.add_watch(path)
+            except OSError as e:
+                error = e.strerror
+            else:
+                self.watches[wd]   = path
+                self.watched[path] = wd
+                return
+
+        if top is None:
+            raise RuntimeError("Unable to watch {}: {}".format(path, error))
+        self.logger.warn("Unable to watch {} ({}); it will be rescanned instead.".format(top, error))
+        self.unwatched.add(top)
+        self._drop_watches(top)
+
+    def _drop_watches(self, path):
+        """
+        Stops watching a directory and everything inside of it.
+        """
+        prefix = path + os.sep
+        for directory in [d for d in self.watched if d == path or d.startswith(prefix)]:
+            wd = self.watched.pop(directory)
+            self.watches.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def _forget_watch(self, wd):
+        """
+        Forgets a watch that the kernel has already dropped.
+        """
+        path = self.watches.pop(wd, None)
+        if path is not None and self.watched.get(path) == wd:
+            del self.watched[path]
+
+
+def watch(target, logger, interval, run, max_watches=8192, one_file_system=False):
+    """
+    Keeps a live index of a target directory and hands its inventory to 'run'
+    every 'interval' seconds. Runs until interrupted.
+
+    :param target: the directory to watch
+    :param logger: a Management Tools logger object
+    :param interval: the number of seconds between runs
+    :param run: a function taking (folders, files, links) as returned by
+                analysis.get_inventory(), and the symlinks.LinkResolver the
+                links were resolved with
+    :param max_watches: the most directories to watch at once
+    :param one_file_system: whether to stay on the filesystem of 'target'
+    """
+    index = LiveIndex(target, logger, max_watches=max_watches, one_file_system=one_file_system)
+    try:
+        index.scan()
+        next_run = time.time()
+        while True:
+            index.wait(max(next_run - time.time(), 0))
+            if time.time() >= next_run:
+                # The tree changes between runs, so each one gets a fresh
+                # resolver.
+                resolver              = symlinks.LinkResolver(target)
+                folders, files, links = index.get_inventory(resolver)
+                run(folders, files, links, resolver)
+                next_run = time.time() + interval
+    finally:
+        index.close()
@@ -10,32 +10,74 @@ import sys
 import time
 
 
-try:
-    from management_tools import loggers
-    from management_tools import fs_analysis as fsa
-    # Check for MT version 1.8.1
-    if not "bytes" in dir(fsa.Filesystem):
-        raise ImportError
-except ImportError as e:
-    print("You need version 1.8.1 or greater of the 'Management Tools' module to be installed first.")
-    print("https://github.com/univ-of-utah-marriott-library-apple/management_tools")
-    raise e
-
-
-def main(target, keep_after, free_space, oldest_first, skip_prompt, overflow, dir_trigger, logger):
+def main(target, keep_after, free_space, oldest_first, skip_prompt, overflow, dir_trigger, one_file_system, report, estimate, journal_path, resume, journal_sync, max_records, spill_dir, scan_workers, scan_state, delete_workers, locality_order, logger):
     # Get an absolute reference to the target path.
     target = os.path.abspath(os.path.expanduser(target))
 
-    # Obtain the initial inventory.
-    folders, files, links = cleanup_management.analysis.get_inventory(target, logger)
-
-    # Build the appropriate deletion inventory.
-    if keep_after is not None:
-        delete_folders, delete_files, delete_links = cleanup_management.analysis.get_date_based_deletable_inventory(keep_after=keep_after, logger=logger, folders=folders, files=files, links=links, trigger=dir_trigger)
-    elif free_space is not None and oldest_first is not None:
-        delete_folders, delete_files, delete_links, deleted_space = cleanup_management.analysis.get_size_based_deletable_inventory(target_space=free_space, logger=logger, oldest_first=oldest_first, overflow=overflow, folders=folders, files=files, links=links)
+    if free_space is not None:
+        cleanup_management.metrics.set_value('freeup_target_bytes', free_space)
+
+    # Start scanning with as many workers as the last scan of this volume ended
+    # up using.
+    scan_start = 1
+    if scan_workers is not None and scan_state is not None:
+        from cleanup_management import scan
+        scan_start = scan.load_level(scan_state, target) or 1
+
+    if estimate is not None:
+        # Just give a quick idea of what's in the target. Estimates are never
+        # good enough to decide what to delete.
+        from cleanup_management import estimate as estimation
+        estimates = estimation.get_estimates(target, logger, budget=estimate, one_file_system=one_file_system)
+        estimation.log_estimates(estimates, logger)
+        return
+
+    if resume is not None:
+        # Pick up where an interrupted run left off. The journal already holds
+        # the plan, so there's no need to look at the target again.
+        from cleanup_management import journal as journaling
+        logger.info("Resuming cleanup from journal: {}".format(resume))
+        delete_links, delete_files, delete_folders = journaling.load_pending(resume)
+        journal_path = resume
+
+        # Carry on deleting the same way the plan was meant to be carried out,
+        # whatever was given this time.
+        recorded = journaling.load_options(resume).get('one_file_system') == 'True'
+        if recorded != one_file_system:
+            logger.info("Using the journal's setting for --one-file-system: {}".format(recorded))
+        one_file_system = recorded
+    elif free_space is not None and max_records is not None and not report:
+        # Plan straight from the target without keeping the whole inventory in
+        # memory.
+        delete_folders, delete_files, delete_links, deleted_space = cleanup_management.analysis.get_bounded_size_based_deletable_inventory(target_space=free_space, logger=logger, target=target, oldest_first=oldest_first, overflow=overflow, max_records=max_records, spill_dir=spill_dir, one_file_system=one_file_system, scan_workers=scan_workers, scan_start=scan_start)
+        if scan_workers is not None and scan_state is not None:
+            scan.save_level(scan_state, target, cleanup_management.metrics.get('scan_workers'))
     else:
-        raise RuntimeError("Did not specify either --keep-after or --freeup.")
+        # Trigger files only have an effect with date-based deletion, and they
+        # let the scan skip the recursive walk of any folder that contains one.
+        # Reports need real sizes, so they never skip folders this way.
+        triggers = dir_trigger if keep_after is not None and not report else None
+
+        # Obtain the initial inventory. The links are resolved with the same
+        # resolver that plans the cleanup, so nothing is resolved twice.
+        resolver = cleanup_management.symlinks.LinkResolver(target)
+        folders, files, links = cleanup_management.analysis.get_inventory(target, logger, one_file_system=one_file_system, triggers=triggers, scan_workers=scan_workers, scan_start=scan_start, resolver=resolver)
+        if scan_workers is not None and scan_state is not None:
+            scan.save_level(scan_state, target, cleanup_management.metrics.get('scan_workers'))
+
+        # Just describe the inventory if that's all that was wanted.
+        if report:
+            from cleanup_management import report as reporting
+            reporting.log_report(folders, files, logger, target_space=free_space)
+            return
+
+        # Build the appropriate deletion inventory.
+        if keep_after is not None:
+            delete_folders, delete_files, delete_links = cleanup_management.analysis.get_date_based_deletable_inventory(keep_after=keep_after, logger=logger, folders=folders, files=files, links=links, trigger=dir_trigger, resolver=resolver)
+        elif free_space is not None and oldest_first is not None:
+            delete_folders, delete_files, delete_links, deleted_space = cleanup_management.analysis.get_size_based_deletable_inventory(target_space=free_space, logger=logger, oldest_first=oldest_first, overflow=overflow, folders=folders, files=files, links=links, resolver=resolver)
+        else:
+            raise RuntimeError("Did not specify either --keep-after or --freeup.")
 
     # Inform the user about stuff (if they wanted it).
     if not skip_prompt:
@@ -59,17 +101,56 @@ def main(target, keep_after, free_space, oldest_first, skip_prompt, overflow, di
         if not query_yes_no("Proceed with cleanup?"):
             sys.exit(7)
 
-    if keep_after:
+    if resume is not None:
+        logger.info("Deleting {} remaining items from the journal".format(len(delete_links) + len(delete_files) + len(delete_folders)))
+    elif keep_after:
         logger.info("Deleting contents recursively older than {} from {}".format(datetime.datetime.fromtimestamp(keep_after), target))
     else:
         logger.info("Deleting {} bytes of data from {}".format(deleted_space, target))
 
+    # Record the plan before anything is deleted so an interrupted run can be
+    # resumed later.
+    journal = None
+    if journal_path is not None:
+        from cleanup_management import journal as journaling
+        journal = journaling.Journal(journal_path, resume=resume is not None, sync_interval=journal_sync)
+        if resume is None:
+            journal.write_plan(delete_links, delete_files, delete_folders, options={'one_file_system': str(bool(one_file_system))})
+
+    try:
+        delete_inventory(delete_links, delete_files, delete_folders, one_file_system, journal, delete_workers, locality_order, logger)
+    finally:
+        if journal is not None:
+            journal.close()
+
+    logger.info("Cleanup complete.")
+
+
+def delete_inventory(delete_links, delete_files, delete_folders, one_file_system, journal, delete_workers, locality_order, logger):
+    """
+    Deletes the links, then the files, and then the folders.
+
+    :param delete_links: A list of links to be unmade.
+    :param delete_files: A list of files to be deleted.
+    :param delete_folders: A list of folders to be deleted.
+    :param one_file_system: Whether to stay on one device when deleting folders.
+    :param journal: A Journal to record completed deletions in (or None).
+    :param delete_workers: The number of threads to remove each folder with.
+    :param locality_order: Whether to delete each batch in on-disk order.
+    :param logger: A Management Tools Logger object for handling output.
+    """
+    # The plan is settled by now, so only the order things go in can change.
+    if locality_order:
+        delete_links   = cleanup_management.cleanup.sort_by_locality(delete_links)
+        delete_files   = cleanup_management.cleanup.sort_by_locality(delete_files)
+        delete_folders = cleanup_management.cleanup.sort_by_locality(delete_folders)
+
     # Remove links first.
     if len(delete_links) == 0:
         logger.info("No links to remove.")
     else:
         logger.info("Removing bad links...")
-        cleanup_management.cleanup.delete_links(delete_links, logger)
+        cleanup_management.cleanup.delete_links(delete_links, logger, journal=journal)
         logger.info("Bad links removed.")
 
     # Then delete files.
@@ -77,7 +158,7 @@ def main(target, keep_after, free_space, oldest_first, skip_prompt, overflow, di
         logger.info("No files to remove.")
     else:
         logger.info("Removing files...")
-        cleanup_management.cleanup.delete_files(delete_files, logger)
+        cleanup_management.cleanup.delete_files(delete_files, logger, journal=journal)
         logger.info("Files removed.")
 
     # And then delete folders.
@@ -85,10 +166,54 @@ def main(target, keep_after, free_space, oldest_first, skip_prompt, overflow, di
         logger.info("No folders to remove.")
     else:
         logger.info("Removing folders...")
-        cleanup_management.cleanup.delete_folders(delete_folders, logger)
+        cleanup_management.cleanup.delete_folders(delete_folders, logger, one_file_system=one_file_system, journal=journal, workers=delete_workers)
         logger.info("Folders removed.")
 
-    logger.info("Cleanup complete.")
+
+def watch_main(target, keep_after, date_format, freeup, oldest_first, overflow, one_file_system, interval, max_watches, delete_workers, locality_order, metrics_file, logger):
+    """
+    Watches the target and cleans it up every 'interval' seconds, using a live
+    index of the target instead of scanning it each time. The keep-after date
+    and freeup amount are worked out afresh for every run, so relative dates
+    and free space targets stay current. If a metrics file is given, it is
+    rewritten after every run.
+    """
+    # Get an absolute reference to the target path.
+    target = os.path.abspath(os.path.expanduser(target))
+
+    def run(folders, files, links, resolver):
+        try:
+            clean_up(folders, files, links, resolver)
+        finally:
+            if metrics_file is not None:
+                cleanup_management.metrics.write_textfile(metrics_file)
+                cleanup_management.metrics.reset()
+
+    def clean_up(folders, files, links, resolver):
+        if keep_after is not None:
+            keep_after_time = date_to_unix(keep_after, date_format)
+            delete_folders, delete_files, delete_links = cleanup_management.analysis.get_date_based_deletable_inventory(keep_after=keep_after_time, logger=logger, folders=folders, files=files, links=links, resolver=resolver)
+        else:
+            try:
+                free_space = volume_size_target(freeup, target, logger)
+            except NothingToFreeUp as e:
+                logger.verbose("Nothing to free up: {}".format(e))
+                return
+            cleanup_management.metrics.set_value('freeup_target_bytes', free_space)
+            delete_folders, delete_files, delete_links, deleted_space = cleanup_management.analysis.get_size_based_deletable_inventory(target_space=free_space, logger=logger, oldest_first=oldest_first, overflow=overflow, folders=folders, files=files, links=links, resolver=resolver)
+
+        if not delete_links and not delete_files and not delete_folders:
+            logger.verbose("Nothing to clean up.")
+            return
+        delete_inventory(delete_links, delete_files, delete_folders, one_file_system, None, delete_workers, locality_order, logger)
+
+    logger.info("Watching {} and cleaning up every {} seconds.".format(target, interval))
+    try:
+        from cleanup_management import watch
+        watch.watch(target, logger, interval, run, max_watches=max_watches, one_file_system=one_file_system)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching {}.".format(target))
+
 
 def query_yes_no(question):
     """
@@ -159,11 +284,16 @@ Delete old items from a specific directory, but only at a top-level granularity.
     -f size, --freeup size
         The amount of space to attempt to free up.
     -t trigger, --dir-trigger trigger
-        Sets a specific file to look for in the top-level of directories inside
-        the specified target directory. If this file exists, its timestamp will
-        be used in place of the directory's timestamp to determine removal. If
-        the file does not exist, the timestamp for the directory will be found
-        through the usual method.
+        Sets a specific file (or directory) to look for in the top-level of
+        directories inside the specified target directory. If it exists, its
+        timestamp will be used in place of the directory's timestamp to
+        determine removal (and the directory's contents will not be searched).
+        If it does not exist, the timestamp for the directory will be found
+        through the usual method. The trigger may be a glob pattern (eg
+        '*.lock'), and this option may be given multiple times; if several
+        triggers are found, the most recent timestamp among them is used.
+        Since the size of a directory with a trigger is never measured, it
+        counts as 0 bytes in the '--metrics-file' byte counts.
             (Only has an effect with date-based deletion.)
     --delete-oldest-first
         When deleting by size, older items are deleted first to free up the
@@ -178,6 +308,83 @@ Delete old items from a specific directory, but only at a top-level granularity.
         to - but not more than - the amount.) This is useful when your top-level
         directory only contains items that are greater in size than the target
         free space amount.
+    --report
+        Do not delete anything. Instead, show how the items in the target are
+        distributed by age and size, and how much space a range of keep-after
+        dates would free up. If '--freeup' is also given, the earliest
+        keep-after date that would free up that much space is shown too.
+    --estimate
+        Like '--report', but much faster on very large targets. Instead of
+        walking every folder, a limited number of random paths through each one
+        are examined and used to estimate its size, along with confidence
+        bounds. Nothing is ever deleted based on an estimate.
+    --estimate-budget count
+        The number of items '--estimate' may examine in total. This is a hard
+        limit; any items it runs out before are shown with an unknown size.
+        default: 100000
+    --max-records count
+        When deleting by size, hold no more than 'count' inventory items in
+        memory at once. Any more are sorted in batches on disk and merged back
+        together while planning. Useful for folders containing tens of millions
+        of items. The resulting plan is the same either way. This does not
+        bound everything: the listing of the target's top level, the paths of
+        its top-level folders, and all links found are still held in memory.
+    --spill-dir path
+        Where to keep the sorted batches used by '--max-records'.
+        default: the system's temporary directory
+    --journal path
+        Keep a journal of the cleanup at 'path'. The full plan is written before
+        anything is deleted, and each completed deletion is recorded as it
+        happens.
+    --resume path
+        Finish an interrupted cleanup from the journal at 'path' without
+        looking through the target directory again. The journal's own
+        '--one-file-system' setting is used, and a journal whose plan was never
+        completely written is refused.
+    --journal-sync seconds
+        How often completed deletions are synced to the journal on disk.
+        default: 1
+    --watch seconds
+        Keep running and clean up the target every 'seconds' seconds. The target
+        is scanned once, and after that the age and size of everything in it are
+        kept current by watching for changes (using inotify), so each cleanup
+        costs almost nothing. Requires Linux and '--skip-prompt', and cannot be
+        combined with '--report', '--estimate', '--journal', '--resume',
+        '--dir-trigger', '--max-records', '--spill-dir', '--scan-workers', or
+        '--scan-state'.
+    --max-watches count
+        The most directories to watch at once with '--watch'. Folders that can't
+        be watched completely are rescanned before each cleanup instead.
+        default: 8192
+    --scan-workers count
+        Look through the target's folders with up to 'count' threads at once.
+        The scan starts out with a single thread (or wherever '--scan-state'
+        says the last scan of the volume ended up) and adds more for as long as
+        that speeds things up, backing off again if the volume slows down. The
+        number it settles on is logged.
+    --scan-state path
+        Remember the number of threads '--scan-workers' settled on for each
+        volume in the file at 'path', and start there the next time any target
+        on that volume is scanned.
+    --delete-workers count
+        Remove the contents of each folder using 'count' threads at once. This
+        helps when a single folder holds a very large number of items.
+        default: 1
+    --locality-order
+        Once the items to delete have been decided, delete them in the order
+        they are laid out on disk (by parent directory and inode number) rather
+        than oldest- or largest-first. This can speed up deletion on spinning
+        disks and RAID volumes.
+    --metrics-file path
+        When the run finishes, write out statistics about the scan and cleanup
+        (durations, entries visited, items and bytes planned and deleted, and
+        errors) to 'path' in the Prometheus text format, for use with
+        node_exporter's textfile collector. With '--watch', the file is
+        rewritten after every cleanup.
+    --one-file-system
+        Stay on the filesystem that the target directory lives on. Mounted
+        network shares, disk images, and other volumes found inside of the
+        target are neither scanned nor deleted from.
 
     target
         The top-level directory to delete from within.
@@ -349,6 +556,13 @@ def date_to_unix(date, date_format):
     return unix_time
 
 
+class NothingToFreeUp(ValueError):
+    """
+    Raised by volume_size_target() when there is already enough free space.
+    """
+    pass
+
+
 def volume_size_target(size, target, logger=None):
     """
     Converts a size into a number of bytes to clear up on the filesystem where
@@ -377,9 +591,10 @@ def volume_size_target(size, target, logger=None):
     :param logger: a Management Tools logger (if you want some things logged)
     :return: the number of bytes that should be freed up if possible
     :return type: int
+    :raises NothingToFreeUp: if there is already enough free space
     """
     # Get the filesystem information for 'target'.
-    volume = fsa.Filesystem(fsa.get_responsible_fs(target))
+    volume = cleanup_management.volume.get_volume(target)
     delete_target = None
     try:
         # Is it just the percentage?
@@ -428,7 +643,7 @@ def volume_size_target(size, target, logger=None):
 
     # Check that the volume can actually have that much space deleted.
     if delete_target < 0:
-        raise ValueError("Negative target deletion size encountered - is there already enough free space?")
+        raise NothingToFreeUp("Negative target deletion size encountered - is there already enough free space?")
     if delete_target > volume.bytes:
         if logger:
             logger.warn("Too many bytes to delete; will delete as much as possible.")
@@ -452,10 +667,26 @@ if __name__ == '__main__':
     parser.add_argument('-k', '--keep-after', default=None)
     parser.add_argument('-d', '--date-format', default='%Y-%m-%d')
     parser.add_argument('-f', '--freeup', default=None)
-    parser.add_argument('-t', '--dir-trigger', default=None)
+    parser.add_argument('-t', '--dir-trigger', action='append', default=None)
     parser.add_argument('--delete-oldest-first', action='store_true', default=True)
     parser.add_argument('--delete-largest-first', action='store_false', dest='delete_oldest_first')
     parser.add_argument('--overflow', action='store_true')
+    parser.add_argument('--one-file-system', action='store_true')
+    parser.add_argument('--report', action='store_true')
+    parser.add_argument('--estimate', action='store_true')
+    parser.add_argument('--estimate-budget', type=int, default=100000)
+    parser.add_argument('--max-records', type=int, default=None)
+    parser.add_argument('--spill-dir', default=None)
+    parser.add_argument('--journal', default=None)
+    parser.add_argument('--resume', default=None)
+    parser.add_argument('--journal-sync', type=float, default=1.0)
+    parser.add_argument('--watch', type=float, default=None)
+    parser.add_argument('--max-watches', type=int, default=8192)
+    parser.add_argument('--scan-workers', type=int, default=None)
+    parser.add_argument('--scan-state', default=None)
+    parser.add_argument('--delete-workers', type=int, default=1)
+    parser.add_argument('--locality-order', action='store_true')
+    parser.add_argument('--metrics-file', default=None)
     parser.add_argument('target', nargs='?', default=os.getcwd())
 
     # Parse the arguments.
@@ -467,6 +698,33 @@ if __name__ == '__main__':
     if not args.keep_after and not args.freeup:
         args.keep_after = '-7dr'
 
+    if args.estimate and (args.watch is not None or args.resume is not None):
+        parser.error("--estimate cannot be used with --watch or --resume.")
+
+    if args.estimate_budget < 1:
+        parser.error("--estimate-budget must be at least 1.")
+
+    if args.report and args.resume is not None:
+        parser.error("--report cannot be used with --resume, since resuming deletes whatever is left in the journal.")
+
+    if args.watch is not None and not args.skip_prompt:
+        parser.error("--watch requires --skip-prompt, since nobody will be around to answer.")
+
+    if args.watch is not None:
+        ignored = [
+            ('--report',       args.report),
+            ('--journal',      args.journal),
+            ('--resume',       args.resume),
+            ('--dir-trigger',  args.dir_trigger),
+            ('--max-records',  args.max_records),
+            ('--spill-dir',    args.spill_dir),
+            ('--scan-workers', args.scan_workers),
+            ('--scan-state',   args.scan_state),
+        ]
+        for option, value in ignored:
+            if value is not None and value is not False:
+                parser.error("{} cannot be used with --watch.".format(option))
+
     if args.help:
         usage()
         sys.exit(0)
@@ -485,7 +743,7 @@ if __name__ == '__main__':
         log_level = 5
 
     # Build the logger.
-    logger = loggers.get_logger(
+    logger = cleanup_management.logs.get_logger(
         name  = 'cleanup_manager',
         log   = not args.no_log,
         level = log_level,
@@ -493,32 +751,78 @@ if __name__ == '__main__':
     )
 
     # Set output logging prompts.
-    for logging_level in [x for x in logger.prompts.keys() if x <= loggers.INFO]:
+    for logging_level in [x for x in logger.prompts.keys() if x <= cleanup_management.logs.INFO]:
         logger.set_prompt(logging_level, '')
 
-    # Get the necessary information to perform cleanup. Either calculate the
-    # unix date of the time to delete before, or find the amount of space to
-    # delete off the given volume.
-    if args.keep_after:
-        free_space = None
-        keep_after = date_to_unix(args.keep_after, args.date_format)
-    elif args.freeup:
-        keep_after = None
-        free_space = volume_size_target(args.freeup, args.target, logger)
-
-    # Run it!
+    # Keep cleaning up for as long as we're allowed to.
+    if args.watch is not None:
+        try:
+            watch_main(
+                target          = args.target,
+                keep_after      = args.keep_after,
+                date_format     = args.date_format,
+                freeup          = args.freeup,
+                oldest_first    = args.delete_oldest_first,
+                overflow        = args.overflow,
+                one_file_system = args.one_file_system,
+                interval        = args.watch,
+                max_watches     = args.max_watches,
+                delete_workers  = args.delete_workers,
+                locality_order  = args.locality_order,
+                metrics_file    = args.metrics_file,
+                logger          = logger,
+            )
+        except:
+            # Output the exception with the error name and its message. Suppresses the stack trace.
+            logger.error("{errname}: {error}".format(errname=sys.exc_info()[0].__name__, error=' '.join([str(x) for x in sys.exc_info()[1]])))
+            raise
+        sys.exit(0)
+
+    # Start counting for the metrics.
+    cleanup_management.metrics.reset()
+
+    # Run it! The metrics are written however it ends, including when there
+    # turns out to be nothing to do.
     try:
+        # Get the necessary information to perform cleanup. Either calculate
+        # the unix date of the time to delete before, or find the amount of
+        # space to delete off the given volume.
+        if args.keep_after:
+            free_space = None
+            keep_after = date_to_unix(args.keep_after, args.date_format)
+        elif args.freeup:
+            keep_after = None
+            free_space = volume_size_target(args.freeup, args.target, logger)
+
         main(
-            target       = args.target,
-            keep_after   = keep_after,
-            free_space   = free_space,
-            oldest_first = args.delete_oldest_first,
-            skip_prompt  = args.skip_prompt,
-            overflow     = args.overflow,
-            dir_trigger  = args.dir_trigger,
-            logger       = logger,
+            target          = args.target,
+            keep_after      = keep_after,
+            free_space      = free_space,
+            oldest_first    = args.delete_oldest_first,
+            skip_prompt     = args.skip_prompt,
+            overflow        = args.overflow,
+            dir_trigger     = args.dir_trigger,
+            one_file_system = args.one_file_system,
+            report          = args.report,
+            estimate        = args.estimate_budget if args.estimate else None,
+            journal_path    = args.journal,
+            resume          = args.resume,
+            journal_sync    = args.journal_sync,
+            max_records     = args.max_records,
+            spill_dir       = args.spill_dir,
+            scan_workers    = args.scan_workers,
+            scan_state      = args.scan_state,
+            delete_workers  = args.delete_workers,
+            locality_order  = args.locality_order,
+            logger          = logger,
         )
+    except NothingToFreeUp as e:
+        logger.info("Nothing to free up: {}".format(e))
+        cleanup_management.metrics.set_value('freeup_target_bytes', 0)
     except:
         # Output the exception with the error name and its message. Suppresses the stack trace.
         logger.error("{errname}: {error}".format(errname=sys.exc_info()[0].__name__, error=' '.join([str(x) for x in sys.exc_info()[1]])))
         raise
+    finally:
+        if args.metrics_file is not None:
+            cleanup_management.metrics.write_textfile(args.metrics_file)
@@ -0,0 +1,12 @@
+import sys
+
+
+class QuietLogger(object):
+    """
+    Stands in for a Management Tools logger and drops everything but errors.
+    """
+    def verbose(self, message): pass
+    def debug(self, message): pass
+    def info(self, message): pass
+    def warn(self, message): pass
+    def error(self, message): sys.stderr.write(message + '\n')
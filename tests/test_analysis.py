@@ -0,0 +1,179 @@
+import random
+import unittest
+
+from cleanup_management import analysis, filesystem, metrics, symlinks
+
+from tests.helpers import QuietLogger
+
+
+def build_tree(seed, count=60):
+    """
+    :return: an in-memory filesystem with a random target at '/t', holding
+             folders, files (with plenty of tied ages and sizes), and links
+    """
+    rng = random.Random(seed)
+    fs  = filesystem.MemoryFilesystem()
+    fs.makedirs('/t')
+    fs.makedirs('/elsewhere')
+    for index in range(count):
+        path  = '/t/item{}'.format(index)
+        mtime = rng.randint(0, 20)
+        kind  = rng.random()
+        if kind < 0.4:
+            fs.mkdir(path, mtime)
+            for child in range(rng.randint(0, 3)):
+                fs.add_file('{}/f{}'.format(path, child), rng.randint(0, 10) * 100, rng.randint(0, 20))
+            if rng.random() < 0.3:
+                fs.symlink('/t/item0', path + '/inner')
+        elif kind < 0.9:
+            fs.add_file(path, rng.randint(0, 10) * 100, mtime)
+        else:
+            fs.symlink(rng.choice(['item0', 'item1', '/elsewhere']), path)
+    return fs
+
+
+class BoundedPlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_matches_in_memory_planner(self):
+        logger = QuietLogger()
+        for seed in range(15):
+            fs = build_tree(seed)
+            folders, files, links = analysis.get_inventory('/t', logger, fs=fs)
+            total = sum(item[2] for item in folders + files)
+            for oldest_first in [True, False]:
+                for overflow in [True, False]:
+                    for target_space in [0, 1, total // 3, total, total * 2]:
+                        expected = analysis.get_size_based_deletable_inventory(
+                            target_space, logger, oldest_first=oldest_first, overflow=overflow,
+                            folders=folders, files=files, links=links, fs=fs
+                        )
+                        for max_records in [1, 7, 1000]:
+                            result = analysis.get_bounded_size_based_deletable_inventory(
+                                target_space, logger, '/t', oldest_first=oldest_first, overflow=overflow,
+                                max_records=max_records, fs=fs
+                            )
+                            self.assertEqual(result[:2], expected[:2])
+                            self.assertEqual(sorted(result[2]), sorted(expected[2]))
+                            self.assertEqual(result[3], expected[3])
+
+
+class ScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_matches_sequential_walk(self):
+        logger = QuietLogger()
+        for seed in range(10):
+            fs = build_tree(seed)
+            for triggers in [None, ['f0'], ['f?', 'inner']]:
+                expected = analysis.get_inventory('/t', logger, triggers=triggers, fs=fs)
+                for workers, start in [(1, 1), (4, 1), (8, 8)]:
+                    result = analysis.get_inventory('/t', logger, triggers=triggers, scan_workers=workers, scan_start=start, fs=fs)
+                    # The links inside of each folder may come out in another
+                    # order, but everything else is the same.
+                    self.assertEqual(result[0], expected[0])
+                    self.assertEqual(result[1], expected[1])
+                    self.assertEqual(sorted(result[2]), sorted(expected[2]))
+
+
+class SharedResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_planning_reuses_the_scan(self):
+        logger = QuietLogger()
+        for seed in range(10):
+            fs      = build_tree(seed)
+            checked = []
+            islink  = fs.islink
+            fs.islink = lambda path: checked.append(path) or islink(path)
+
+            resolver = symlinks.LinkResolver('/t', fs)
+            folders, files, links = analysis.get_inventory('/t', logger, fs=fs, resolver=resolver)
+            scanned = len(checked)
+            for planner, limit in [(analysis.get_date_based_deletable_inventory, 10),
+                                   (analysis.get_size_based_deletable_inventory, 2000)]:
+                expected = planner(limit, logger, folders=folders, files=files, links=links, fs=fs)
+                del checked[scanned:]
+                result = planner(limit, logger, folders=folders, files=files, links=links, fs=fs, resolver=resolver)
+                self.assertEqual(result, expected)
+                # Everything planned was already resolved during the scan.
+                self.assertEqual(len(checked), scanned)
+
+
+class _ListingFilesystem(filesystem.MemoryFilesystem):
+    """
+    An in-memory filesystem that remembers every directory that was listed.
+    """
+
+    def __init__(self):
+        super(_ListingFilesystem, self).__init__()
+        self.listed = []
+
+    def listdir(self, path):
+        self.listed.append(path)
+        return super(_ListingFilesystem, self).listdir(path)
+
+
+class TriggerTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        fs = _ListingFilesystem()
+        fs.makedirs('/t')
+        # Plain files as triggers, in several folders in a row.
+        for name in ['a', 'b', 'c']:
+            fs.makedirs('/t/{}/deep'.format(name), 1)
+            fs.add_file('/t/{}/deep/data'.format(name), 100, 1)
+            fs.symlink('/t', '/t/{}/deep/link'.format(name))
+        fs.add_file('/t/a/.keep', 0, 50)
+        fs.add_file('/t/b/.keep', 0, 60)
+        fs.add_file('/t/c/keep.txt', 0, 70)
+        fs.add_file('/t/c/keep.log', 0, 75)
+        # A directory as the trigger.
+        fs.makedirs('/t/d/.keep', 80)
+        fs.add_file('/t/d/data', 100, 1)
+        # No trigger at all.
+        fs.makedirs('/t/e/deep', 1)
+        fs.add_file('/t/e/deep/keep', 100, 1)
+        self.fs = fs
+
+    def test_triggers(self):
+        folders, files, links = analysis.get_inventory('/t', QuietLogger(), triggers=['.keep', 'keep.*'], fs=self.fs)
+        self.assertEqual(sorted(folders), [
+            ('/t/a', 50, None),
+            ('/t/b', 60, None),
+            ('/t/c', 75, None),
+            ('/t/d', 80, None),
+            ('/t/e', 1, 100),
+        ])
+        self.assertEqual(files, [])
+        # The folders with triggers were never walked, so none of the links
+        # deep inside of them were found.
+        self.assertEqual(links, [])
+        self.assertEqual(sorted(path for path in self.fs.listed if path.startswith('/t/') and path.count('/') > 2), ['/t/e/deep'])
+
+    def test_single_trigger(self):
+        folders = analysis.get_inventory('/t', QuietLogger(), triggers='.keep', fs=self.fs)[0]
+        self.assertEqual([folder[0] for folder in sorted(folders) if folder[2] is None], ['/t/a', '/t/b', '/t/d'])
+
+    def test_scanner_matches(self):
+        expected = analysis.get_inventory('/t', QuietLogger(), triggers=['.keep', 'keep.*'], fs=self.fs)
+        for workers in [1, 4]:
+            result = analysis.get_inventory('/t', QuietLogger(), triggers=['.keep', 'keep.*'], scan_workers=workers, fs=self.fs)
+            self.assertEqual(sorted(result[0]), sorted(expected[0]))
+            self.assertEqual(sorted(result[2]), sorted(expected[2]))
+
+    def test_size_planner_refuses_unmeasured_folders(self):
+        folders, files, links = analysis.get_inventory('/t', QuietLogger(), triggers='.keep', fs=self.fs)
+        self.assertRaises(ValueError, analysis.get_size_based_deletable_inventory, 100, QuietLogger(),
+                          folders=folders, files=files, links=links, fs=self.fs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from cleanup_management import cleanup, filesystem, metrics
+
+from tests.helpers import QuietLogger
+
+
+def build_tree(root, seed, outside, count=200):
+    """
+    Fills 'root' on disk with a random tree of nested folders, files, and links
+    (some of which point at 'outside', which must survive removal).
+
+    :return: the number of entries created
+    """
+    rng     = random.Random(seed)
+    folders = [root]
+    for index in range(count):
+        parent = rng.choice(folders)
+        path   = os.path.join(parent, 'item{}'.format(index))
+        kind   = rng.random()
+        if kind < 0.35:
+            os.mkdir(path)
+            folders.append(path)
+        elif kind < 0.85:
+            with open(path, 'w') as output:
+                output.write('x' * rng.randint(0, 100))
+        else:
+            os.symlink(rng.choice([outside, os.path.join(outside, 'kept'), root, 'missing']), path)
+    return count
+
+
+class _SplitFilesystem(filesystem.MemoryFilesystem):
+    """
+    An in-memory filesystem where everything under 'mount' is on another device.
+    """
+
+    def __init__(self, mount):
+        super(_SplitFilesystem, self).__init__()
+        self.mount = mount
+
+    def lstat(self, path):
+        info = super(_SplitFilesystem, self).lstat(path)
+        if path == self.mount or path.startswith(self.mount + '/'):
+            info.st_dev = 2
+        return info
+
+
+class RemoveTreeParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.scratch = tempfile.mkdtemp(prefix='test_cleanup.')
+        self.outside = os.path.join(self.scratch, 'outside')
+        os.mkdir(self.outside)
+        open(os.path.join(self.outside, 'kept'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def test_removes_random_trees(self):
+        for seed in range(10):
+            for workers in [1, 2, 3, 8]:
+                root = os.path.join(self.scratch, 'tree-{}-{}'.format(seed, workers))
+                os.mkdir(root)
+                build_tree(root, seed, self.outside)
+                self.assertTrue(cleanup.remove_tree_parallel(root, QuietLogger(), workers, progress_every=7))
+                self.assertFalse(os.path.lexists(root))
+                # Links are removed, never followed.
+                self.assertEqual(os.listdir(self.outside), ['kept'])
+
+    def test_stays_on_device(self):
+        fs = _SplitFilesystem('/t/a/mount')
+        fs.makedirs('/t/a/mount/deep')
+        fs.add_file('/t/a/mount/deep/file')
+        fs.add_file('/t/a/file')
+        fs.makedirs('/t/b/c')
+        fs.add_file('/t/b/c/file')
+        for workers in [1, 4]:
+            self.assertFalse(cleanup.remove_tree_parallel('/t', QuietLogger(), workers, device=1, fs=fs))
+            # The other device and the folders holding it are left; everything
+            # else is gone.
+            self.assertEqual(fs.listdir('/t'), ['a'])
+            self.assertEqual(fs.listdir('/t/a'), ['mount'])
+            self.assertEqual(fs.listdir('/t/a/mount/deep'), ['file'])
+
+    def test_delete_folders_with_workers(self):
+        folders = []
+        for index in range(5):
+            folder = os.path.join(self.scratch, 'folder{}'.format(index))
+            os.mkdir(folder)
+            build_tree(folder, index, self.outside, count=50)
+            folders.append(folder)
+        cleanup.delete_folders(folders, QuietLogger(), one_file_system=True, workers=4)
+        for folder in folders:
+            self.assertFalse(os.path.lexists(folder))
+        self.assertEqual(metrics.get('deleted_items', kind='folder'), len(folders))
+        self.assertEqual(metrics.get('errors', kind='folder'), 0)
@@ -0,0 +1,78 @@
+import random
+import unittest
+
+from cleanup_management import estimate, filesystem
+
+from tests.helpers import QuietLogger
+
+
+class _CountingFilesystem(filesystem.MemoryFilesystem):
+    """
+    An in-memory filesystem that counts the listings and lstat() calls made.
+    """
+
+    def __init__(self):
+        super(_CountingFilesystem, self).__init__()
+        self.calls = 0
+
+    def listdir(self, path):
+        self.calls += 1
+        return super(_CountingFilesystem, self).listdir(path)
+
+    def lstat(self, path):
+        self.calls += 1
+        return super(_CountingFilesystem, self).lstat(path)
+
+
+def build_tree(seed, folders=30):
+    """
+    :return: a counting filesystem with a target at '/t' holding a few files
+             and 'folders' random, nested folders
+    """
+    rng = random.Random(seed)
+    fs  = _CountingFilesystem()
+    fs.makedirs('/t')
+    for index in range(5):
+        fs.add_file('/t/file{}'.format(index), 100, 1)
+    for index in range(folders):
+        directories = ['/t/folder{}'.format(index)]
+        fs.mkdir(directories[0], 1)
+        for child in range(rng.randint(0, 40)):
+            parent = rng.choice(directories)
+            path   = '{}/c{}'.format(parent, child)
+            if rng.random() < 0.3:
+                fs.mkdir(path, 1)
+                directories.append(path)
+            else:
+                fs.add_file(path, rng.randint(1, 1000), 1)
+    return fs
+
+
+class EstimateBudgetTest(unittest.TestCase):
+
+    def test_budget_is_a_hard_limit(self):
+        for seed in range(5):
+            for budget in [1, 2, 10, 37, 100, 500]:
+                fs = build_tree(seed)
+                fs.calls = 0
+                estimates = estimate.get_estimates('/t', QuietLogger(), budget=budget, seed=seed, fs=fs)
+                # The isdir() and stat() of the target itself aren't counted.
+                self.assertLessEqual(fs.calls, budget)
+                self.assertEqual(len(estimates), 35)
+
+    def test_unknown_items(self):
+        fs        = build_tree(0)
+        estimates = estimate.get_estimates('/t', QuietLogger(), budget=10, seed=0, fs=fs)
+        unknown   = [item for item in estimates if not item.known]
+        self.assertTrue(unknown)
+        for item in unknown:
+            self.assertEqual(item.probes, 0)
+            self.assertIsNone(item.lower)
+        # Nothing unknown is counted as having been measured.
+        estimate.log_estimates(estimates, QuietLogger(), now=86400 * 400)
+
+    def test_large_budget_probes_every_folder(self):
+        fs        = build_tree(1)
+        estimates = estimate.get_estimates('/t', QuietLogger(), budget=100000, seed=1, fs=fs)
+        self.assertTrue(all(item.known for item in estimates))
+        self.assertTrue(all(item.probes >= estimate.MIN_PROBES for item in estimates if 'folder' in item.path))
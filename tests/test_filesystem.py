@@ -0,0 +1,69 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from cleanup_management import filesystem
+
+
+class MemoryFilesystemTest(unittest.TestCase):
+
+    def test_lookups_follow_changes(self):
+        fs = filesystem.MemoryFilesystem()
+        fs.makedirs('/a/b')
+        fs.add_file('/a/b/f', 10)
+        self.assertTrue(fs.isdir('/a/b'))
+        self.assertEqual(fs.getsize('/a/b/f'), 10)
+
+        # Remembered directories must be forgotten once they're gone.
+        fs.rmtree('/a/b')
+        self.assertFalse(fs.lexists('/a/b/f'))
+        fs.add_file('/a/b', 5)
+        self.assertFalse(fs.isdir('/a/b'))
+        self.assertRaises(OSError, fs.listdir, '/a/b')
+
+        fs.remove('/a/b')
+        fs.mkdir('/a/b')
+        self.assertEqual(fs.listdir('/a/b'), [])
+
+    def test_matches_disk(self):
+        # The same tree on disk and in memory answers every lookup the same.
+        fs      = filesystem.MemoryFilesystem()
+        scratch = os.path.realpath(tempfile.mkdtemp(prefix='test_filesystem.'))
+        try:
+            for directory in ['d/e', 'g', '.hidden/.more']:
+                os.makedirs(os.path.join(scratch, directory))
+                fs.makedirs(os.path.join(scratch, directory))
+            for path in ['d/file', 'd/e/file']:
+                open(os.path.join(scratch, path), 'w').close()
+                fs.add_file(os.path.join(scratch, path))
+            for target, link in [('d/e', 'l1'), ('../d', 'g/l2'), ('l3', 'l3'), ('missing', 'l4'), (scratch + '/d/file', 'l5')]:
+                os.symlink(target, os.path.join(scratch, link))
+                fs.symlink(target, os.path.join(scratch, link))
+
+            # '..' is handled lexically in memory, so it never follows a link.
+            queries = ['', '.', './', 'd/./../g', 'd//', 'd', 'd/', 'd/./e', 'd/e/..', 'd//e/file', 'd/file/x',
+                       'l1', 'l1/file', 'g/l2/e', 'l3', 'l3/x', 'l4', 'l5', 'l5/x', 'nope/x', '.hidden',
+                       '.hidden/.more', '.hidden/./.more/.', '.hidden/.more/..']
+            for query in queries:
+                path = os.path.join(scratch, query)
+                for name in ['isdir', 'islink', 'lexists']:
+                    self.assertEqual(getattr(fs, name)(path), getattr(os.path, name)(path), (name, query))
+                for name in ['listdir', 'lstat', 'stat']:
+                    try:
+                        expected = getattr(os, name)(path)
+                    except OSError as e:
+                        expected = e.errno
+                    try:
+                        actual = getattr(fs, name)(path)
+                    except OSError as e:
+                        actual = e.errno
+                    if name == 'listdir' and not isinstance(expected, int):
+                        expected = sorted(expected)
+                    elif name != 'listdir' and not isinstance(expected, int):
+                        expected = stat.S_IFMT(expected.st_mode)
+                        actual   = stat.S_IFMT(actual.st_mode)
+                    self.assertEqual(actual, expected, (name, query))
+        finally:
+            shutil.rmtree(scratch)
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cleanup_management import journal
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_raw(self, text):
+        with open(self.path, 'w') as handle:
+            handle.write(text)
+
+    def test_round_trip(self):
+        links   = ['/t/link']
+        files   = ['/t/file one', '/t/new\nline', '/t/back\\slash']
+        folders = ['/t/a', '/t/b']
+        log = journal.Journal(self.path)
+        log.write_plan(links, files, folders)
+        log.complete('file', '/t/new\nline')
+        log.complete('folder', '/t/a')
+        log.close()
+
+        self.assertEqual(journal.load_pending(self.path), (['/t/link'], ['/t/file one', '/t/back\\slash'], ['/t/b']))
+
+    def test_everything_complete(self):
+        log = journal.Journal(self.path)
+        log.write_plan(['/t/l'], ['/t/f'], ['/t/d'])
+        for kind, path in [('link', '/t/l'), ('file', '/t/f'), ('folder', '/t/d')]:
+            log.complete(kind, path)
+        log.close()
+
+        self.assertEqual(journal.load_pending(self.path), ([], [], []))
+
+    def test_torn_line_is_ignored(self):
+        self.write_raw('P folder /Users/bob-old\nP folder /Users/alice-old\nplan done\nD folder /Users/alice')
+
+        self.assertEqual(journal.load_pending(self.path), ([], [], ['/Users/bob-old', '/Users/alice-old']))
+
+    def test_unfinished_plan_is_refused(self):
+        # A run died while writing the plan entry for '/Users/alice-old', so
+        # nobody knows what else was meant to be deleted.
+        self.write_raw('P folder /Users/bob-old\nP folder /Users/alice')
+        self.assertRaises(ValueError, journal.load_pending, self.path)
+
+        self.write_raw('P folder /Users/bob-old\n')
+        self.assertRaises(ValueError, journal.load_pending, self.path)
+
+    def test_resume_drops_torn_line(self):
+        # A run died while writing the completion marker for '/Users/bob-old'.
+        self.write_raw('P folder /Users/bob\nP folder /Users/bob-old\nplan done\nD folder /Users/bob')
+
+        log = journal.Journal(self.path, resume=True)
+        log.complete('folder', '/Users/bob-old')
+        log.close()
+        self.assertEqual(journal.load_pending(self.path), ([], [], ['/Users/bob']))
+
+        # Resuming again must never turn the fragment into a completed path.
+        journal.Journal(self.path, resume=True).close()
+        self.assertEqual(journal.load_pending(self.path), ([], [], ['/Users/bob']))
+        with open(self.path) as handle:
+            self.assertNotIn('D folder /Users/bob\n', handle.read())
+
+    def test_options_round_trip(self):
+        log = journal.Journal(self.path)
+        log.write_plan([], ['/t/a'], [], options={'one_file_system': 'True', 'odd': 'a b\nc'})
+        log.complete('file', '/t/a')
+        log.close()
+
+        self.assertEqual(journal.load_options(self.path), {'one_file_system': 'True', 'odd': 'a b\nc'})
+        self.assertEqual(journal.load_pending(self.path), ([], [], []))
+
+    def test_resume_torn_completion(self):
+        self.write_raw('P file /t/a\nP file /t/b\nplan done\nD file /t/')
+
+        log = journal.Journal(self.path, resume=True)
+        self.assertEqual(journal.load_pending(self.path), ([], ['/t/a', '/t/b'], []))
+        log.complete('file', '/t/a')
+        log.close()
+        self.assertEqual(journal.load_pending(self.path), ([], ['/t/b'], []))
+
+    def test_resume_torn_line_longer_than_a_chunk(self):
+        self.write_raw('P file /t/a\nP file /t/' + 'x' * 10000)
+
+        journal.Journal(self.path, resume=True).close()
+        self.assertEqual(os.path.getsize(self.path), len('P file /t/a\n'))
+
+    def test_resume_without_complete_lines(self):
+        self.write_raw('P fol')
+
+        journal.Journal(self.path, resume=True).close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_resume_intact_journal(self):
+        log = journal.Journal(self.path)
+        log.write_plan([], ['/t/a', '/t/b'], [])
+        log.close()
+        size = os.path.getsize(self.path)
+
+        log = journal.Journal(self.path, resume=True)
+        self.assertEqual(os.path.getsize(self.path), size)
+        log.complete('file', '/t/b')
+        log.close()
+        self.assertEqual(journal.load_pending(self.path), ([], ['/t/a'], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import StringIO
+import sys
+import unittest
+
+from cleanup_management import logs
+
+
+class FallbackLoggerTest(unittest.TestCase):
+
+    def test_shared_logger_prints_once(self):
+        output, sys.stdout = sys.stdout, StringIO.StringIO()
+        try:
+            first  = logs.FallbackLogger('test_logs.shared', log=False)
+            second = logs.FallbackLogger('test_logs.shared', log=False)
+            second.info("once")
+            second.set_prompt(logs.INFO, 'I: ')
+            first.info("again")
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = output
+        self.assertEqual(printed, "INFO: once\nI: again\n")
@@ -0,0 +1,89 @@
+import random
+import unittest
+
+from cleanup_management import analysis, report
+
+from tests.helpers import QuietLogger
+
+
+def deleted_before(keep_after, folders, files):
+    """
+    :return: the number and combined size of the items a keep-after would delete
+    """
+    items = [item for item in folders + files if item[1] < keep_after]
+    return len(items), sum(item[2] or 0 for item in items)
+
+
+class MinimumKeepAfterTest(unittest.TestCase):
+
+    def test_tied_ages(self):
+        # Only the first of the tied items is needed, but a keep-after can't
+        # split them up.
+        files = [('/t/a', 100, 10), ('/t/b', 100, 10), ('/t/c', 200, 10)]
+        self.assertEqual(report.get_minimum_keep_after(5, [], files), (101, 2, 20))
+        self.assertEqual(report.get_minimum_keep_after(20, [], files), (101, 2, 20))
+        self.assertEqual(report.get_minimum_keep_after(21, [], files), (201, 3, 30))
+
+    def test_nothing_to_free(self):
+        files = [('/t/a', 100, 10), ('/t/b', 200, 10)]
+        self.assertEqual(report.get_minimum_keep_after(0, [], files), (100, 0, 0))
+        self.assertEqual(report.get_minimum_keep_after(0, [], []), (0, 0, 0))
+
+    def test_more_than_everything(self):
+        files = [('/t/a', 100, 10), ('/t/b', 200, 10)]
+        self.assertEqual(report.get_minimum_keep_after(20, [], files), (201, 2, 20))
+        self.assertIsNone(report.get_minimum_keep_after(21, [], files))
+        self.assertIsNone(report.get_minimum_keep_after(1, [], []))
+
+    def test_float_ages(self):
+        # Everything within the same whole second goes together.
+        files = [('/t/a', 100.2, 10), ('/t/b', 100.7, 10), ('/t/c', 101.0, 10)]
+        self.assertEqual(report.get_minimum_keep_after(10, [], files), (101, 2, 20))
+        self.assertEqual(report.get_minimum_keep_after(20, [], files), (101, 2, 20))
+        self.assertEqual(report.get_minimum_keep_after(21, [], files), (102, 3, 30))
+
+    def test_unmeasured_folders(self):
+        folders = [('/t/a', 100, None), ('/t/b', 200, 10)]
+        self.assertEqual(report.get_minimum_keep_after(10, folders, []), (201, 2, 10))
+
+    def test_matches_date_planner(self):
+        logger = QuietLogger()
+        for seed in range(20):
+            rng   = random.Random(seed)
+            items = [('/t/item{}'.format(index), rng.choice([rng.randint(0, 50), rng.uniform(0, 50)]), rng.randint(0, 100))
+                     for index in range(rng.randint(1, 40))]
+            folders = items[::2]
+            files   = items[1::2]
+            total   = sum(item[2] for item in items)
+            for target_space in range(0, total + 2, 7):
+                result = report.get_minimum_keep_after(target_space, folders, files)
+                if target_space > total:
+                    self.assertIsNone(result)
+                    continue
+                keep_after, count, size = result
+                self.assertEqual((count, size), deleted_before(keep_after, folders, files))
+                self.assertGreaterEqual(size, target_space)
+                # A second earlier wouldn't have been enough.
+                if target_space > 0:
+                    self.assertLess(deleted_before(keep_after - 1, folders, files)[1], target_space)
+
+                planned = analysis.get_date_based_deletable_inventory(keep_after, logger, folders=folders, files=files, links=[])
+                self.assertEqual(len(planned[0]) + len(planned[1]), count)
+
+
+class AgeDistributionTest(unittest.TestCase):
+
+    def test_thresholds(self):
+        now   = 100 * 86400
+        files = [('/t/a', now - 3 * 86400, 10), ('/t/b', now - 7 * 86400, 20), ('/t/c', now - 30 * 86400 - 0.5, 40)]
+        folders = [('/t/d', now - 7 * 86400 - 1, None)]
+        distribution = report.get_age_distribution(folders, files, now=now, thresholds=[30, 1, 7])
+        self.assertEqual(distribution, [
+            (1, now - 86400, 4, 70),
+            # Exactly 7 days old isn't older than 7 days.
+            (7, now - 7 * 86400, 2, 40),
+            (30, now - 30 * 86400, 1, 40),
+        ])
+
+    def test_empty(self):
+        self.assertEqual(report.get_age_distribution([], [], now=0, thresholds=[1]), [(1, -86400, 0, 0)])
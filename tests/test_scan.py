@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cleanup_management import scan
+
+
+class LevelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp(prefix='test_scan.'))
+        self.state     = os.path.join(self.directory, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_levels_are_kept_per_volume(self):
+        first  = os.path.join(self.directory, 'first')
+        second = os.path.join(self.directory, 'second')
+        os.mkdir(first)
+        os.mkdir(second)
+
+        self.assertIsNone(scan.load_level(self.state, first))
+        scan.save_level(self.state, first, 8)
+        # Another target on the same volume starts where the first left off.
+        self.assertEqual(scan.load_level(self.state, second), 8)
+        scan.save_level(self.state, second, 4)
+        self.assertEqual(scan.load_level(self.state, first), 4)
+
+        with open(self.state) as state:
+            self.assertEqual(json.load(state), {scan.get_mount_point(first): 4})
+
+    def test_other_volumes_are_kept(self):
+        with open(self.state, 'w') as state:
+            json.dump({'/elsewhere': 16}, state)
+        scan.save_level(self.state, self.directory, 2)
+        with open(self.state) as state:
+            self.assertEqual(json.load(state), {'/elsewhere': 16, scan.get_mount_point(self.directory): 2})
+
+    def test_unreadable_state(self):
+        with open(self.state, 'w') as state:
+            state.write('not json')
+        self.assertIsNone(scan.load_level(self.state, self.directory))
+        scan.save_level(self.state, self.directory, 2)
+        self.assertEqual(scan.load_level(self.state, self.directory), 2)
+
+    def test_mount_point(self):
+        self.assertEqual(scan.get_mount_point('/'), '/')
+        mount = scan.get_mount_point(self.directory)
+        self.assertTrue(os.path.ismount(mount))
+        self.assertTrue(self.directory == mount or self.directory.startswith(mount.rstrip('/') + '/'))
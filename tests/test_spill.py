@@ -0,0 +1,58 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from cleanup_management import spill
+
+
+class SpillSorterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def sort(self, records, max_records, max_runs=64):
+        sorter = spill.SpillSorter(max_records, directory=self.directory, max_runs=max_runs)
+        try:
+            for record in records:
+                sorter.add(record)
+            return list(sorter), len(sorter.runs)
+        finally:
+            sorter.close()
+
+    def test_fits_in_memory(self):
+        records = [(3, 'c'), (1, 'a'), (2, 'b')]
+        result, runs = self.sort(records, 10)
+        self.assertEqual(result, sorted(records))
+        self.assertEqual(runs, 0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_random_records(self):
+        rng = random.Random(0)
+        for trial in range(20):
+            records = [(rng.randint(-50, 50), rng.randint(0, 1), index, 'path{}'.format(index)) for index in range(rng.randint(0, 500))]
+            max_records = rng.randint(1, 40)
+            max_runs    = rng.randint(2, 6)
+            result, runs = self.sort(records, max_records, max_runs)
+            self.assertEqual(result, sorted(records))
+            self.assertLessEqual(runs, max_runs)
+
+    def test_close_removes_runs(self):
+        sorter = spill.SpillSorter(2, directory=self.directory)
+        for record in range(10):
+            sorter.add((record,))
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        sorter.close()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rejects_bad_limits(self):
+        self.assertRaises(ValueError, spill.SpillSorter, 0)
+        self.assertRaises(ValueError, spill.SpillSorter, 10, max_runs=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
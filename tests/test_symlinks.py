@@ -0,0 +1,102 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+
+from cleanup_management import analysis, filesystem, metrics, symlinks
+
+from tests.helpers import QuietLogger
+
+
+def build_tree(root, seed, count=80):
+    """
+    Fills 'root' on disk with a random tree of folders, files, and links. The
+    links are absolute and relative, go up with '..', are broken, and form
+    loops.
+
+    :return: every path created
+    """
+    rng     = random.Random(seed)
+    folders = [root]
+    paths   = []
+    for index in range(count):
+        parent = rng.choice(folders)
+        path   = os.path.join(parent, 'item{}'.format(index))
+        kind   = rng.random()
+        if kind < 0.3:
+            os.mkdir(path)
+            folders.append(path)
+        elif kind < 0.5:
+            open(path, 'w').close()
+        else:
+            choice = rng.random()
+            if choice < 0.3 and paths:
+                # Absolute, to anything made so far (including other links).
+                target = rng.choice(paths)
+            elif choice < 0.6 and paths:
+                # Relative, possibly through '..' and on past the target.
+                target = os.path.relpath(rng.choice(paths), parent)
+                if rng.random() < 0.3:
+                    target = os.path.join(target, 'more')
+            elif choice < 0.8:
+                # A loop, either through the next link or straight back.
+                target = rng.choice(['item{}'.format(index + 1), 'item{}'.format(index), '../item{}'.format(index)])
+            else:
+                target = 'missing'
+            os.symlink(target, path)
+        paths.append(path)
+    return paths
+
+
+class LinkResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.scratch = os.path.realpath(tempfile.mkdtemp(prefix='test_symlinks.'))
+
+    def tearDown(self):
+        shutil.rmtree(self.scratch)
+
+    def test_matches_realpath(self):
+        for seed in range(20):
+            root = os.path.join(self.scratch, 'tree{}'.format(seed))
+            os.mkdir(root)
+            paths    = build_tree(root, seed)
+            resolver = symlinks.LinkResolver(root)
+            # Resolve in a random order, since the cache is shared.
+            random.Random(seed).shuffle(paths)
+            for path in paths:
+                for query in [path, os.path.join(path, 'x'), os.path.join(path, '..', 'y')]:
+                    self.assertEqual(resolver.resolve(query), os.path.realpath(query), query)
+
+    def test_is_inside_compares_components(self):
+        fs = filesystem.MemoryFilesystem()
+        fs.makedirs('/a/b')
+        resolver = symlinks.LinkResolver('/a/b', fs)
+        self.assertTrue(resolver.is_inside('/a/b'))
+        self.assertTrue(resolver.is_inside('/a/b/c'))
+        self.assertFalse(resolver.is_inside('/a/bc'))
+        self.assertFalse(resolver.is_inside('/a'))
+
+    def test_target_through_link(self):
+        # The target is given through a link (like /tmp on macOS), and a link
+        # in a folder that's kept points into a folder that isn't.
+        real = os.path.join(self.scratch, 'real')
+        os.makedirs(os.path.join(real, 'old'))
+        os.makedirs(os.path.join(real, 'new'))
+        open(os.path.join(real, 'old', 'file'), 'w').close()
+        open(os.path.join(real, 'new', 'file'), 'w').close()
+        os.symlink('../old/file', os.path.join(real, 'new', 'link'))
+        os.utime(os.path.join(real, 'old', 'file'), (1000, 1000))
+        os.utime(os.path.join(real, 'old'), (1000, 1000))
+        target = os.path.join(self.scratch, 'sym')
+        os.symlink(real, target)
+
+        for path in [target, real]:
+            folders, files, links = analysis.get_date_based_deletable_inventory(
+                time.time() - 86400, QuietLogger(), target=path
+            )
+            self.assertEqual(folders, [os.path.join(path, 'old')])
+            self.assertEqual(links, [os.path.join(path, 'new', 'link')])
@@ -0,0 +1,59 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from cleanup_management import analysis, watch
+
+from tests.helpers import QuietLogger
+
+
+class _WarningLogger(QuietLogger):
+    """
+    Keeps every warning it's given.
+    """
+
+    def __init__(self):
+        self.warnings = []
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), "inotify is only available on Linux")
+class LiveIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.target = os.path.realpath(tempfile.mkdtemp(prefix='test_watch.'))
+        for folder in ['a/1/2/3', 'b']:
+            os.makedirs(os.path.join(self.target, folder))
+        for path in ['a/file', 'a/1/2/3/file', 'b/file', 'top']:
+            with open(os.path.join(self.target, path), 'w') as output:
+                output.write('x' * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.target)
+
+    def test_unwatched_folder_is_not_watched_again(self):
+        logger = _WarningLogger()
+        index  = watch.LiveIndex(self.target, logger, max_watches=3)
+        try:
+            index.scan()
+            warnings = len(logger.warnings)
+            self.assertEqual(warnings, 1)
+            watches = dict(index.watched)
+
+            for _ in range(3):
+                folders, files, links = index.get_inventory()
+                self.assertEqual(len(logger.warnings), warnings)
+                self.assertEqual(index.watched, watches)
+                self.assertEqual(sorted(folders), sorted(analysis.get_inventory(self.target, QuietLogger())[0]))
+
+            # Changes inside the unwatched folder are still picked up.
+            with open(os.path.join(self.target, 'a/1/2/3/more'), 'w') as output:
+                output.write('x' * 5)
+            folders = dict((path, size) for path, age, size in index.get_inventory()[0])
+            self.assertEqual(folders[os.path.join(self.target, 'a')], 25)
+        finally:
+            index.close()